@@ -0,0 +1 @@
+# Makes the repository root importable for the tests in tests/
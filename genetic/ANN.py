@@ -143,6 +143,88 @@ class ANN:
         return pickle.load(open(file_path, "rb"))
     
 
+class ANNBatch:
+    """
+        K networks with the same architecture, evaluated together with one matmul per layer.
+        Like ANN.predict every column of the input is one observation, every network gets its own observations and
+        keeps the feedback of its last hidden layer per column.
+    """
+
+    def __init__(self, weight_matrices, batch_size=1, feedback=True):
+        """
+            @param weight_matrices: per layer the (K, out_dim, in_dim + 1) weights of the K networks
+            @param batch_size: number of observations (columns) per network
+            @param feedback: feedback of prev last hidden layer
+        """
+        self.weight_matrices = [np.asarray(theta, dtype=np.float64) for theta in weight_matrices]
+        self.num_networks = self.weight_matrices[0].shape[0]
+        self.batch_size = batch_size
+        self.feedback = feedback and len(self.weight_matrices) > 1
+        self.feedback_layer = len(self.weight_matrices) - 2
+
+        # Preallocate the layer inputs, the first row is the bias and for the feedback layer the last rows hold the
+        # activations of the prev last hidden layer
+        self.layer_inputs = [np.ones((self.num_networks, theta.shape[2], batch_size))
+                             for theta in self.weight_matrices]
+        self.outputs = np.empty((self.num_networks, self.weight_matrices[-1].shape[1], batch_size))
+        if self.feedback:
+            self.hidden_dim = self.weight_matrices[self.feedback_layer].shape[1]
+            self.prev_hidden = self.layer_inputs[self.feedback_layer][:, -self.hidden_dim:, :]
+        self.reset()
+
+    @staticmethod
+    def from_anns(anns, batch_size=1, feedback=True):
+        weight_matrices = [np.stack(matrices) for matrices in zip(*[ann.weight_matrices for ann in anns])]
+        return ANNBatch(weight_matrices, batch_size=batch_size, feedback=feedback)
+
+    def reset(self, prev_hidden=None):
+        """
+            Resets the feedback, random activations like ANN.predict if none are given
+        """
+        if not self.feedback:
+            return
+        if prev_hidden is None:
+            prev_hidden = np.random.uniform(0, 1, size=self.prev_hidden.shape)
+        self.prev_hidden[...] = prev_hidden
+
+    def predict(self, x):
+        """
+            @param x: (K, input_dims, batch_size) observations to predict on
+            @return: (K, output_dims, batch_size) predictions
+        """
+        num_layers = len(self.weight_matrices)
+        inputs = self.layer_inputs[0]
+        inputs[:, 1:1 + x.shape[1], :] = x
+        for i, theta in enumerate(self.weight_matrices):
+            # Write the activations straight into the input of the next layer
+            if i == num_layers - 1:
+                z = self.outputs
+            else:
+                next_inputs = self.layer_inputs[i + 1]
+                z = next_inputs[:, 1:1 + theta.shape[1], :]
+            np.matmul(theta, inputs, out=z)
+            self.sigmoid(z)
+
+            # Keep the last hidden layer as feedback for the next prediction
+            if self.feedback and i == self.feedback_layer:
+                self.prev_hidden[...] = z
+            if i < num_layers - 1:
+                inputs = next_inputs
+
+        return self.outputs
+
+    @staticmethod
+    def sigmoid(x):
+        """
+            In place sigmoid
+        """
+        np.negative(x, out=x)
+        np.exp(x, out=x)
+        x += 1
+        np.reciprocal(x, out=x)
+        return x
+
+
 if __name__ == "__main__":
     cn = ANN(input_dims=8, output_dims=8, hidden_dims=[3])
     cn.show()
@@ -0,0 +1,78 @@
+import numpy as np
+
+
+# Why an episode ended, the index is the termination code of EarlyStopping
+TERMINATIONS = ["completed", "no_displacement", "no_new_cells", "score_bound"]
+
+
+class EarlyStopping:
+    """
+        Early termination rules for a batch of episodes, checked after every step.
+        An episode stops when the robot moved less than min_displacement over the last window steps, when it cleaned
+        no new cells over the last window steps, or when even cleaning as fast as possible for the rest of the
+        episode can not get its score above score_threshold.
+        A stopped episode is scored as if the robot stays where it stopped: no new cells and the penalty of its
+        last step for every remaining step.
+    """
+    def __init__(self, num_episodes, steps, window=0, min_displacement=0.0, stop_on_no_new_cells=False,
+                 score_threshold=None, max_new_cells=0, total_cells=0):
+        """
+            @param window: number of steps the displacement and the new cells are measured over, 0 disables both
+            @param max_new_cells: upper bound on the number of cells a robot can clean in one step
+            @param total_cells: number of cells in the dust grid
+        """
+        self.steps = steps
+        self.window = window
+        self.min_displacement = min_displacement
+        self.stop_on_no_new_cells = stop_on_no_new_cells
+        self.score_threshold = score_threshold
+        self.max_new_cells = max_new_cells
+        self.total_cells = total_cells
+
+        self.step = 0
+        self.codes = np.zeros(num_episodes, dtype=np.int64)
+        self.remaining_penalties = np.zeros(num_episodes)
+        # Ring buffers with the positions and cleaned cells of the last window + 1 steps
+        self.positions = np.zeros((window + 1, num_episodes, 2))
+        self.cleaned = np.zeros((window + 1, num_episodes))
+
+    @property
+    def active(self):
+        return self.codes == 0
+
+    def check(self, x, y, cleaned_cells, penalties, step_penalties):
+        """
+            Checks the rules after a step and stops the episodes that break one of them
+            @param penalties: the penalties so far, including this step
+            @param step_penalties: the penalties of this step
+        """
+        self.step += 1
+        slot = self.step % (self.window + 1)
+        self.positions[slot, :, 0] = x
+        self.positions[slot, :, 1] = y
+        self.cleaned[slot] = cleaned_cells
+        remaining_steps = self.steps - self.step
+        if remaining_steps <= 0:
+            return
+
+        stop = np.zeros(len(self.codes), dtype=np.int64)
+        if self.score_threshold is not None:
+            reachable = np.minimum(self.total_cells, cleaned_cells + remaining_steps * self.max_new_cells)
+            stop = np.where(reachable - penalties < self.score_threshold, 3, stop)
+        if (self.window > 0) and (self.step > self.window):
+            # The oldest slot of the ring buffer is exactly window steps ago, nothing was written window steps before
+            # the first step
+            old = (self.step + 1) % (self.window + 1)
+            if self.stop_on_no_new_cells:
+                stop = np.where(cleaned_cells == self.cleaned[old], 2, stop)
+            if self.min_displacement > 0:
+                delta = self.positions[slot] - self.positions[old]
+                moved = np.sqrt(delta[:, 0] ** 2 + delta[:, 1] ** 2)
+                stop = np.where(moved < self.min_displacement, 1, stop)
+
+        stopped = self.active & (stop > 0)
+        self.codes[stopped] = stop[stopped]
+        self.remaining_penalties[stopped] = remaining_steps * step_penalties[stopped]
+
+    def termination_counts(self):
+        return np.bincount(self.codes, minlength=len(TERMINATIONS))
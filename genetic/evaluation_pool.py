@@ -0,0 +1,119 @@
+import numpy as np
+import multiprocessing as mp
+from multiprocessing import shared_memory, resource_tracker
+import random
+import time
+
+# State of the worker processes, every worker builds its evaluation function only once
+_worker = {}
+
+
+def _init_worker(factory, factory_args):
+    # Forked workers inherit the random state of the parent, reseed so they do not all see the same episodes
+    np.random.seed()
+    random.seed()
+    _worker["evaluate"] = factory(**factory_args)
+    _worker["memory"] = {}
+    # A forked worker shares the resource tracker of the parent, a spawned one starts its own when it attaches
+    _worker["own_tracker"] = resource_tracker._resource_tracker._fd is None
+
+
+def _attach(name):
+    if name not in _worker["memory"]:
+        memory = shared_memory.SharedMemory(name=name)
+        # The parent owns the block, do not let the resource tracker of the worker remove it. A shared tracker holds
+        # the registration of the parent, which the parent removes itself when it unlinks the block
+        if _worker["own_tracker"]:
+            resource_tracker.unregister(memory._name, "shared_memory")
+        # The parent only allocates a new block when the old one is too small, the old one is not used anymore
+        for old in _worker["memory"].values():
+            old.close()
+        _worker["memory"] = {name: memory}
+    return _worker["memory"][name]
+
+
+def _evaluate_rows(task):
+    name, shape, start, end, kwargs = task
+    memory = _attach(name)
+    genomes = np.ndarray(shape, dtype=np.float64, buffer=memory.buf)
+    return start, end, np.asarray(_worker["evaluate"](genomes[start:end].copy(), **kwargs))
+
+
+def _evaluate_genomes(genomes, kwargs):
+    start = time.time()
+    fitness = np.asarray(_worker["evaluate"](genomes, **kwargs))
+    return fitness, time.time() - start
+
+
+class EvaluationPool:
+    """
+        Persistent pool of worker processes for batched fitness evaluation.
+        Every worker calls factory(**factory_args) once to build its evaluation function, this function maps a
+        (k, genome_size) array of genomes to k fitness values. The genomes are shared with the workers through shared
+        memory, the workers get contiguous chunks of rows and return the fitness values per chunk.
+    """
+    def __init__(self, factory, factory_args, processes=None, chunks_per_process=2):
+        self.processes = processes if processes is not None else mp.cpu_count()
+        self.chunks_per_process = chunks_per_process
+        self.pool = mp.Pool(self.processes, initializer=_init_worker, initargs=(factory, factory_args))
+        self.memory = None
+
+    def evaluate_batch(self, genomes, **kwargs):
+        """
+            Evaluates the genomes on all workers and blocks until all fitness values are back
+            @param kwargs: passed on to the evaluation function of the workers
+        """
+        genomes = np.asarray(genomes, dtype=np.float64)
+        if len(genomes) == 0:
+            return np.empty(0)
+
+        shared = self.__share__(genomes)
+        num_chunks = min(len(genomes), self.processes * self.chunks_per_process)
+        bounds = np.linspace(0, len(genomes), num_chunks + 1).astype(int)
+        tasks = [(self.memory.name, shared.shape, start, end, kwargs) for start, end in zip(bounds[:-1], bounds[1:])]
+
+        # The evaluation function can also return more than one value per genome
+        fitness = None
+        for start, end, results in self.pool.imap_unordered(_evaluate_rows, tasks):
+            if fitness is None:
+                fitness = np.empty((len(genomes),) + results.shape[1:])
+            fitness[start:end] = results
+        return fitness
+
+    def submit(self, genomes, callback, error_callback=None, **kwargs):
+        """
+            Evaluates the genomes asynchronously on the next free worker
+            @param callback: called with the genomes, their fitness values and the time the worker needed
+        """
+        genomes = np.asarray(genomes, dtype=np.float64)
+        self.pool.apply_async(_evaluate_genomes, (genomes, kwargs), callback=lambda result: callback(genomes, *result),
+                              error_callback=error_callback)
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+        if self.memory is not None:
+            self.memory.close()
+            self.memory.unlink()
+            self.memory = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __share__(self, genomes):
+        """
+            Copies the genomes into the shared memory block, a new block is only allocated when the old one is too
+            small
+        """
+        if (self.memory is None) or (self.memory.size < genomes.nbytes):
+            if self.memory is not None:
+                self.memory.close()
+                self.memory.unlink()
+            self.memory = shared_memory.SharedMemory(create=True, size=genomes.nbytes)
+
+        shared = np.ndarray(genomes.shape, dtype=np.float64, buffer=self.memory.buf)
+        shared[:] = genomes
+        return shared
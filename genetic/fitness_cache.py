@@ -0,0 +1,113 @@
+import numpy as np
+import hashlib
+from collections import OrderedDict
+
+
+class FitnessCache:
+    """
+        Remembers the fitness of genomes so unchanged genomes are not evaluated again.
+        The key is a hash of the genome bytes and the evaluation config, the least recently used entries are evicted
+        once more than max_size genomes are cached.
+    """
+    def __init__(self, eval_func=None, eval_batch=None, config="", max_size=10000):
+        assert (eval_func is not None) or (eval_batch is not None), "Either eval_func or eval_batch is required"
+        self.eval_func = eval_func
+        self.eval_batch = eval_batch
+        self.config = hashlib.sha1(str(config).encode()).digest()
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def set_config(self, config):
+        """
+            Switches to another evaluation config, the fitness values of the old config are not used anymore
+        """
+        self.config = hashlib.sha1(str(config).encode()).digest()
+
+    def key(self, genome):
+        genome = np.ascontiguousarray(genome, dtype=np.float64)
+        return hashlib.sha1(self.config + genome.tobytes()).digest()
+
+    def evaluate(self, genome):
+        key = self.key(genome)
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+        self.misses += 1
+        if self.eval_func is not None:
+            fitness = self.eval_func(genome)
+        else:
+            fitness = self.eval_batch(np.asarray(genome)[None, :])[0]
+        self.__store__(key, fitness)
+        return fitness
+
+    def lookup(self, genome):
+        """
+            The cached fitness of the genome without evaluating it, for callers that evaluate asynchronously
+            @return: the fitness, None if the genome is not cached
+        """
+        key = self.key(genome)
+        if key not in self.entries:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return self.entries[key]
+
+    def store(self, genome, fitness):
+        self.__store__(self.key(genome), fitness)
+
+    def evaluate_batch(self, genomes):
+        """
+            Looks up all genomes and evaluates the missing ones together, duplicates are only evaluated once
+        """
+        genomes = np.asarray(genomes)
+        keys = [self.key(genome) for genome in genomes]
+        fitness = np.empty(len(genomes))
+
+        missing = OrderedDict()
+        for i, key in enumerate(keys):
+            if key in self.entries:
+                self.hits += 1
+                self.entries.move_to_end(key)
+                fitness[i] = self.entries[key]
+            elif key in missing:
+                # Duplicate of a genome that is evaluated in this batch
+                self.hits += 1
+                missing[key].append(i)
+            else:
+                self.misses += 1
+                missing[key] = [i]
+
+        if len(missing) > 0:
+            first = [indices[0] for indices in missing.values()]
+            if self.eval_batch is not None:
+                results = self.eval_batch(genomes[first])
+            else:
+                results = [self.eval_func(genome) for genome in genomes[first]]
+            for (key, indices), result in zip(missing.items(), results):
+                fitness[indices] = result
+                self.__store__(key, result)
+
+        return fitness
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total > 0 else 0.0,
+            "size": len(self.entries)
+        }
+
+    def clear(self):
+        self.entries.clear()
+
+    def __store__(self, key, fitness):
+        self.entries[key] = fitness
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
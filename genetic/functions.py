@@ -39,4 +39,25 @@ def distance_mse(x_points, y_points, x_true, y_true):
         sum += (dist - dist_true)**2
 
     mse = sum/float(len(x_points))
-    return mse
\ No newline at end of file
+    return mse
+
+def average_ranks(values):
+    """
+        Ranks starting at 0, tied values get the average of their ranks
+    """
+    values = np.asarray(values).reshape(-1)
+    ranks = np.empty(len(values))
+    ranks[np.argsort(values, kind="stable")] = np.arange(len(values))
+    _, groups, counts = np.unique(values, return_inverse=True, return_counts=True)
+    return (np.bincount(groups.reshape(-1), weights=ranks) / counts)[groups.reshape(-1)]
+
+
+def spearman_correlation(a, b):
+    """
+        Spearman rank correlation with average ranks for ties, 0 if a or b is constant (the correlation is undefined)
+    """
+    rank_a = average_ranks(a)
+    rank_b = average_ranks(b)
+    if (np.ptp(rank_a) == 0) or (np.ptp(rank_b) == 0):
+        return 0.0
+    return float(np.corrcoef(rank_a, rank_b)[0, 1])
@@ -106,4 +106,147 @@ class Population:
         x = self.init_func(size=self.genome_size)
         fitness = self.eval_func(x)
         ind = {"pos": x, "fitness": fitness}
-        return ind
\ No newline at end of file
+        return ind
+
+class ArrayPopulation:
+    """
+        Population stored as a (pop_size x genome_size) genome matrix and a fitness vector.
+        Selection, crossover and mutation are whole matrix operations and the new genomes of every step are
+        evaluated together, with eval_batch if it is given and with eval_func per genome otherwise.
+    """
+    def __init__(self, pop_size, genome_size, eval_func=None, eval_batch=None,
+                 mutation_rate=0.1, mutation_scale=0.2,
+                 init_func=np.random.uniform):
+        assert (eval_func is not None) or (eval_batch is not None), "Either eval_func or eval_batch is required"
+        self.pop_size = pop_size
+        self.genome_size = genome_size
+        self.eval_func = eval_func
+        self.eval_batch = eval_batch
+        self.mutation_rate = mutation_rate
+        self.mutation_scale = mutation_scale
+        self.init_func = init_func
+
+        self.genomes = np.asarray(init_func(size=(pop_size, genome_size)), dtype=np.float64)
+        self.fitness = self.evaluate(self.genomes)
+
+    def evaluate(self, genomes):
+        if len(genomes) == 0:
+            return np.empty(0)
+        if self.eval_batch is not None:
+            return np.asarray(self.eval_batch(genomes), dtype=np.float64)
+        return np.array([self.eval_func(genome) for genome in genomes], dtype=np.float64)
+
+    def select(self, percentage):
+        """
+            1) Rank individuals by fitness, the probability is the rank divided by the sum of all ranks
+            2) Select <percentage> according to number obtained in 1)
+        """
+        n = len(self.genomes)
+        ranks = np.empty(n)
+        ranks[np.argsort(self.fitness, kind="stable")] = np.arange(1, n + 1)
+        num = int(n * percentage)
+        selected = np.random.choice(n, num, p=ranks / (n * (n + 1) / 2))
+        self.genomes = self.genomes[selected]
+        self.fitness = self.fitness[selected]
+
+    def regenerate(self):
+        """
+            Generates random genomes until the population is full
+        """
+        children = np.asarray(self.init_func(size=(self.pop_size - len(self.genomes), self.genome_size)))
+        self.__add_children__(children)
+
+    def crossover(self):
+        """
+            Generate some new individuals that are a mix of existing ones, one point crossover
+        """
+        n = len(self.genomes)
+        num_crossovers = (self.pop_size - n) // 2
+        if num_crossovers <= 0:
+            return
+
+        p1 = self.genomes[np.random.randint(0, n, size=num_crossovers)]
+        p2 = self.genomes[np.random.randint(0, n, size=num_crossovers)]
+        # combine genes at "cross over point"
+        crossover_points = np.random.randint(1, self.genome_size, size=num_crossovers)
+        from_first = np.arange(self.genome_size)[None, :] < crossover_points[:, None]
+        c1 = np.where(from_first, p1, p2)
+        c2 = np.where(from_first, p2, p1)
+        self.__add_children__(np.stack((c1, c2), axis=1).reshape(-1, self.genome_size))
+
+    def mutate(self):
+        """
+            mutate some random genomes
+        """
+        mutated = np.flatnonzero(np.random.uniform(0, 1, size=len(self.genomes)) < self.mutation_rate)
+        self.genomes[mutated] += np.random.normal(scale=self.mutation_scale, size=(len(mutated), self.genome_size))
+        self.fitness[mutated] = self.evaluate(self.genomes[mutated])
+
+    def reevaluate(self):
+        """
+            Evaluates all genomes again, the old fitness values are not comparable when the evaluation has changed
+        """
+        self.fitness = self.evaluate(self.genomes)
+
+    def breed(self, num_children):
+        """
+            Creates children without evaluating them, the parents are chosen with the same rank probabilities as
+            select, then one point crossover and mutation are applied
+        """
+        n = len(self.genomes)
+        ranks = np.empty(n)
+        ranks[np.argsort(self.fitness, kind="stable")] = np.arange(1, n + 1)
+        probabilities = ranks / (n * (n + 1) / 2)
+        p1 = self.genomes[np.random.choice(n, num_children, p=probabilities)]
+        p2 = self.genomes[np.random.choice(n, num_children, p=probabilities)]
+
+        crossover_points = np.random.randint(1, self.genome_size, size=num_children)
+        from_first = np.arange(self.genome_size)[None, :] < crossover_points[:, None]
+        children = np.where(from_first, p1, p2)
+
+        mutated = np.random.uniform(0, 1, size=num_children) < self.mutation_rate
+        children[mutated] += np.random.normal(scale=self.mutation_scale, size=(np.sum(mutated), self.genome_size))
+        return children
+
+    def tournament_replace(self, genome, fitness, tournament_size=3):
+        """
+            Inserts an evaluated genome in place of the worst of <tournament_size> random individuals,
+            if it is fitter than that individual
+            @return: True if the genome was inserted
+        """
+        contestants = np.random.choice(len(self.genomes), min(tournament_size, len(self.genomes)), replace=False)
+        loser = contestants[np.argmin(self.fitness[contestants])]
+        if fitness <= self.fitness[loser]:
+            return False
+
+        self.genomes[loser] = genome
+        self.fitness[loser] = fitness
+        return True
+
+    @property
+    def individuals(self):
+        return [{"pos": genome, "fitness": fitness} for genome, fitness in zip(self.genomes, self.fitness)]
+
+    def get_fittest_genome(self):
+        best = np.argmax(self.fitness)
+        return {"pos": self.genomes[best], "fitness": self.fitness[best]}
+
+    def get_max_fitness(self):
+        return np.max(self.fitness)
+
+    def get_average_fitness(self):
+        return np.mean(self.fitness)
+
+    def get_average_diversity(self):
+        # Mean absolute gene difference over all pairs, the same as Population.get_average_diversity
+        return np.mean([np.mean(np.abs(self.genomes - genome)) for genome in self.genomes])
+
+    def show(self):
+        for i in self.individuals:
+            print(f"{i}\n")
+
+    def __add_children__(self, children):
+        # Evaluate all new children at once
+        fitness = self.evaluate(children)
+        self.genomes = np.concatenate((self.genomes, children))
+        self.fitness = np.concatenate((self.fitness, fitness))
@@ -0,0 +1,249 @@
+import numpy as np
+import json
+import queue
+import socket
+import struct
+import threading
+import time
+
+# Messages are a JSON header followed by the raw bytes of the numpy arrays of the message, prefixed with the sizes of
+# both. Nothing on the wire can run code, the arrays are restricted to plain numeric dtypes.
+# Note: the peers are not authenticated, a peer that can reach the coordinator can still send wrong fitness values
+MAX_HEADER_BYTES = 1 << 20
+MAX_ARRAY_BYTES = 1 << 30
+
+
+def encode_message(message):
+    """
+        Encodes a dict of JSON values and numpy arrays
+    """
+    fields = {}
+    arrays = []
+    specs = []
+    for key, value in message.items():
+        if isinstance(value, np.ndarray):
+            array = np.ascontiguousarray(value)
+            if array.dtype.kind not in "biuf":
+                raise ValueError(f"Can not send arrays of dtype {array.dtype}")
+            specs.append({"key": key, "dtype": array.dtype.str, "shape": list(array.shape)})
+            arrays.append(array.tobytes())
+        else:
+            fields[key] = value
+    header = json.dumps({"fields": fields, "arrays": specs}, default=_json_default).encode()
+    payload = b"".join(arrays)
+    return struct.pack("!IQ", len(header), len(payload)) + header + payload
+
+
+def decode_message(header, payload):
+    """
+        Inverse of encode_message, raises a ValueError for malformed messages
+    """
+    header = json.loads(header.decode())
+    message = header["fields"]
+    offset = 0
+    for spec in header["arrays"]:
+        dtype = np.dtype(spec["dtype"])
+        if dtype.kind not in "biuf":
+            raise ValueError(f"Unexpected array dtype {dtype}")
+        shape = tuple(int(size) for size in spec["shape"])
+        nbytes = int(np.prod(shape, dtype=np.int64)) * dtype.itemsize
+        if (min(shape, default=0) < 0) or (offset + nbytes > len(payload)):
+            raise ValueError("Array does not fit in the message")
+        message[spec["key"]] = np.frombuffer(payload, dtype=dtype, count=nbytes // dtype.itemsize,
+                                             offset=offset).reshape(shape).copy()
+        offset += nbytes
+    if offset != len(payload):
+        raise ValueError("Message has trailing bytes")
+    return message
+
+
+def send_message(sock, message, lock=None):
+    data = encode_message(message)
+    if lock is None:
+        sock.sendall(data)
+        return
+    with lock:
+        sock.sendall(data)
+
+
+def recv_message(sock):
+    header_size, payload_size = struct.unpack("!IQ", _recv_exactly(sock, 12))
+    if (header_size > MAX_HEADER_BYTES) or (payload_size > MAX_ARRAY_BYTES):
+        raise ValueError("Message is too large")
+    header = _recv_exactly(sock, header_size)
+    return decode_message(header, _recv_exactly(sock, payload_size))
+
+
+def _json_default(value):
+    # numpy scalars in the kwargs, tuples are already sent as lists
+    if isinstance(value, (np.integer, np.floating, np.bool_)):
+        return value.item()
+    raise TypeError(f"Can not send {type(value).__name__}")
+
+
+def _recv_exactly(sock, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("Connection closed")
+        data += chunk
+    return bytes(data)
+
+
+class EvaluationCoordinator:
+    """
+        Hands out batches of genomes to remote evaluation workers and collects their fitness values.
+        Workers have to send a heartbeat while they evaluate, a batch of a worker that disconnects or misses its
+        heartbeats is put back in the queue for the other workers.
+    """
+    def __init__(self, fingerprint, host="localhost", port=5005, batch_size=10, heartbeat_timeout=10.0):
+        """
+            @param host: interface to listen on, only the local host by default. Use "0.0.0.0" to accept workers
+                         from other hosts, the workers are not authenticated so only do this in a trusted network
+        """
+        self.fingerprint = fingerprint
+        self.batch_size = batch_size
+        self.heartbeat_timeout = heartbeat_timeout
+
+        self.tasks = queue.Queue()
+        self.results = {}
+        self.results_changed = threading.Condition()
+        self.next_batch_id = 0
+        self.closed = False
+        self.requeued = 0
+
+        self.server = socket.create_server((host, port))
+        self.address = self.server.getsockname()
+        self.connections = []
+        self.accept_thread = threading.Thread(target=self.__accept__, daemon=True)
+        self.accept_thread.start()
+
+    def evaluate_batch(self, genomes, **kwargs):
+        """
+            Splits the genomes into batches for the workers and blocks until all fitness values are back
+            @param kwargs: passed on to the evaluation function of the workers
+        """
+        genomes = np.asarray(genomes, dtype=np.float64)
+        batch_ids = []
+        for start in range(0, len(genomes), self.batch_size):
+            batch_id = self.next_batch_id
+            self.next_batch_id += 1
+            batch_ids.append(batch_id)
+            self.tasks.put((batch_id, genomes[start:start + self.batch_size], kwargs))
+
+        with self.results_changed:
+            self.results_changed.wait_for(lambda: all(batch_id in self.results for batch_id in batch_ids))
+            fitness = [self.results.pop(batch_id) for batch_id in batch_ids]
+
+        return np.concatenate(fitness) if len(fitness) > 0 else np.empty(0)
+
+    def num_workers(self):
+        return len(self.connections)
+
+    def close(self):
+        self.closed = True
+        self.server.close()
+        for connection in list(self.connections):
+            try:
+                send_message(connection, {"type": "stop"})
+                connection.close()
+            except OSError:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __accept__(self):
+        while not self.closed:
+            try:
+                connection, _ = self.server.accept()
+            except OSError:
+                break
+            threading.Thread(target=self.__serve__, args=(connection,), daemon=True).start()
+
+    def __serve__(self, connection):
+        task = None
+        try:
+            connection.settimeout(self.heartbeat_timeout)
+            hello = recv_message(connection)
+            if hello.get("fingerprint") != self.fingerprint:
+                # The worker evaluates with a different config, its fitness values are not comparable
+                send_message(connection, {"type": "reject", "fingerprint": self.fingerprint})
+                return
+            send_message(connection, {"type": "welcome"})
+            self.connections.append(connection)
+
+            while not self.closed:
+                try:
+                    task = self.tasks.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+
+                batch_id, genomes, kwargs = task
+                send_message(connection, {"type": "batch", "id": batch_id, "genomes": genomes, "kwargs": kwargs,
+                                          "fingerprint": self.fingerprint})
+                # Wait for the result, every heartbeat resets the timeout
+                while True:
+                    message = recv_message(connection)
+                    if message["type"] == "result" and message["id"] == batch_id:
+                        break
+
+                with self.results_changed:
+                    self.results[batch_id] = np.asarray(message["fitness"], dtype=np.float64)
+                    self.results_changed.notify_all()
+                task = None
+
+        except (OSError, ConnectionError, ValueError, KeyError, TypeError):
+            # Lost the worker, the batch it was working on has to be done by someone else
+            if task is not None:
+                self.requeued += 1
+                self.tasks.put(task)
+        finally:
+            if connection in self.connections:
+                self.connections.remove(connection)
+            connection.close()
+
+
+def run_worker(evaluate_batch, fingerprint, host="localhost", port=5005, heartbeat_interval=2.0):
+    """
+        Connects to a coordinator and evaluates the batches it sends until the coordinator stops
+        @param evaluate_batch: maps a (k, genome_size) array of genomes to k fitness values
+        @param fingerprint: the evaluation config, has to be the same as the one of the coordinator
+    """
+    sock = socket.create_connection((host, port))
+    send_lock = threading.Lock()
+    stopped = threading.Event()
+
+    def heartbeat():
+        while not stopped.wait(heartbeat_interval):
+            try:
+                send_message(sock, {"type": "heartbeat", "time": time.time()}, send_lock)
+            except OSError:
+                break
+
+    try:
+        send_message(sock, {"type": "hello", "fingerprint": fingerprint}, send_lock)
+        reply = recv_message(sock)
+        if reply["type"] != "welcome":
+            raise ValueError("Coordinator rejected the evaluation config of this worker")
+
+        threading.Thread(target=heartbeat, daemon=True).start()
+        while True:
+            try:
+                message = recv_message(sock)
+            except ConnectionError:
+                break
+            if message["type"] == "stop":
+                break
+            if message["fingerprint"] != fingerprint:
+                raise ValueError("Coordinator changed its evaluation config")
+
+            fitness = evaluate_batch(message["genomes"], **message["kwargs"])
+            send_message(sock, {"type": "result", "id": message["id"], "fitness": np.asarray(fitness)}, send_lock)
+    finally:
+        stopped.set()
+        sock.close()
@@ -12,8 +12,11 @@ class DustGridSprite:
         self.cleaned_color = pygame.Color('green')
 
     def update(self, delta_time):
-        x_start, x_end, y_start, y_end = self.dustgrid.x_start, self.dustgrid.x_end, self.dustgrid.y_start, self.dustgrid.y_end
-        pygame.draw.rect(self.surface, self.cleaned_color, (x_start, y_start, x_end - x_start, y_end - y_start))
+        # Draw the cells that were cleaned in the last update
+        cell_size = self.dustgrid.cell_size
+        rows, cols = self.dustgrid.last_cells
+        for row, col in zip(rows, cols):
+            pygame.draw.rect(self.surface, self.cleaned_color, (col * cell_size, row * cell_size, cell_size, cell_size))
         self.surface2.set_at((int(round(self.robot.x)), int(round(self.robot.y))), pygame.Color("black"))
 
     def draw(self, target_surface):
@@ -139,11 +139,12 @@ class MobileRobotGame:
                 # In bounds
                 pygame.draw.circle(self.screen, pygame.Color('orange'), ti(icc), 5)
 
-            # Draw sensors
+            # Draw the last sensor data from where it was collected, this does not trigger a new reading
+            color = pygame.Color('red') if self.robot.sensor_age() == 0 else pygame.Color('pink')
             for hit, dist in self.robot.sensor_data:
                 if hit is None:
                     continue
-                pygame.gfxdraw.line(self.screen, *ti((self.robot.x, self.robot.y)), *ti(hit), pygame.Color('red'))
+                pygame.gfxdraw.line(self.screen, *ti(self.robot.sensor_origin), *ti(hit), color)
 
         # Draw the shape of the robot as an circle with an line marking its rotation
         rotated_x = self.robot.x + math.cos(self.robot.angle) * (self.robot.radius - 1)
@@ -71,7 +71,10 @@ if __name__ == "__main__":
         HEIGHT = 400
         env_params = {"env_width": WIDTH, "env_height": HEIGHT}
         robot_kwargs = {"n_sensors": 12}
-        world_generator = WorldGenerator(WIDTH, HEIGHT, 20, args.world_name, scenario, collision)
+        # The ANN controller requests the sensors when it acts, the human controller only needs them for drawing
+        sensor_period = 0.1 if use_human_controller else None
+        world_generator = WorldGenerator(WIDTH, HEIGHT, 20, args.world_name, scenario, collision,
+                                         sensor_period=sensor_period)
 
         if use_human_controller:
             controller_func = HumanController
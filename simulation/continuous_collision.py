@@ -0,0 +1,259 @@
+import numpy as np
+
+
+def drive_poses(x, y, angle, vl, vr, l, t):
+    """
+        Batched Robot.differential_drive, the poses of the robots after driving for time t along their straight line
+        or arc around the icc
+        @param t: time per robot
+        @return: x, y and the (not wrapped) angle
+    """
+    diff = vr - vl
+    R = l / 2 * (vl + vr) / np.where(diff != 0, diff, 0.0001)  # avoid division by zero
+    icc_x = x - R * np.sin(angle)
+    icc_y = y + R * np.cos(angle)
+    angle_change = (vr - vl) / l * t
+
+    straight = (vr == vl) & (vr != 0)
+    r_x = np.where(straight, x + vr * np.cos(angle) * t,
+                   np.cos(angle_change) * (x - icc_x) - np.sin(angle_change) * (y - icc_y) + icc_x)
+    r_y = np.where(straight, y + vr * np.sin(angle) * t,
+                   np.sin(angle_change) * (x - icc_x) + np.cos(angle_change) * (y - icc_y) + icc_y)
+    return r_x, r_y, angle + angle_change
+
+
+def clearances(wall_set, points, radius, excluded=None):
+    """
+        Distance between the circles at points and the closest wall, walls in the excluded mask are ignored
+        @param excluded: (n, m) mask of walls to ignore per point
+    """
+    dists = wall_set.distances(points)
+    if excluded is not None:
+        dists = np.where(excluded, np.inf, dists)
+    return np.min(dists, axis=1) - radius
+
+
+def _line_impacts(wall_set, starts, velocities, radius):
+    """
+        Earliest time at which circles moving from starts with constant velocities come within radius of a wall.
+        Against the inside of a wall that is a linear equation in time, against its end points a quadratic one.
+        Only roots where the distance decreases count, robots that start within radius of a wall and move away from it
+        are not stopped by it
+        @return: (n, m) time per robot and wall, inf if the robot never gets that close
+    """
+    rel = starts[:, None, :] - wall_set.starts[None]
+    side = np.sum(rel * wall_set.normals, axis=-1)
+    along = np.sum(rel * wall_set.units, axis=-1)
+    v_side = velocities @ wall_set.normals.T
+    v_along = velocities @ wall_set.units.T
+    speed = np.sqrt(np.sum(velocities * velocities, axis=1))[:, None]
+    times = np.full(side.shape, np.inf)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for sign in (1.0, -1.0):
+            t = (sign * radius - side) / v_side
+            a = along + t * v_along
+            valid = (sign * v_side < 0) & (t * speed >= -1e-9) & (a >= 0) & (a <= wall_set.lengths)
+            times = np.where(valid, np.minimum(times, np.maximum(t, 0.0)), times)
+
+        for points in (wall_set.starts, wall_set.ends):
+            d = starts[:, None, :] - points[None]
+            b = np.sum(d * velocities[:, None, :], axis=-1)
+            c = np.sum(d * d, axis=-1) - radius * radius
+            disc = b * b - speed * speed * c
+            t = (-b - np.sqrt(np.maximum(disc, 0.0))) / (speed * speed)
+            valid = (speed > 0) & (b < 0) & (disc >= 0) & (t * speed >= -1e-9)
+            times = np.where(valid, np.minimum(times, np.maximum(t, 0.0)), times)
+    return times
+
+
+def _arc_impacts(wall_set, x, y, angle, vl, vr, l, radius):
+    """
+        Earliest time at which circles driving on arcs (vl != vr) come within radius of a wall. On the arc around the
+        icc the distance to the line of a wall, and the squared distance to an end point, are a constant plus a cosine
+        of the turned angle, so every contact is a solution of cos(phi) = c.
+        Only roots where the distance decreases count, like in _line_impacts
+        @return: (n, m) time per robot and wall, inf if the robot never gets that close
+    """
+    R = l / 2 * (vl + vr) / (vr - vl)
+    arc_radius = np.abs(R)[:, None]
+    icc = np.stack((x - R * np.sin(angle), y + R * np.cos(angle)), axis=1)
+    w = ((vr - vl) / l)[:, None]
+    turn = np.sign(w)
+    start_angle = np.arctan2(y - icc[:, 1], x - icc[:, 0])[:, None]
+    times = np.full((len(x), len(wall_set)), np.inf)
+
+    def solve(c, offset, sign):
+        # The robot is at angle start_angle + a around the icc, the contact at offset + phi with cos(phi) = c.
+        # The distance decreases on the branch of phi with the sign of sign * w
+        phi = np.sign(sign * w) * np.arccos(np.clip(c, -1.0, 1.0))
+        a = turn * np.mod(turn * (phi + offset - start_angle), 2 * np.pi)
+        # A root right at the start can come out a full turn later
+        a = np.where(np.abs(a) > 2 * np.pi - 1e-9, 0.0, a)
+        return a, np.where(np.abs(c) <= 1, a / w, np.inf)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rel = icc[:, None, :] - wall_set.starts[None]
+        side = np.sum(rel * wall_set.normals, axis=-1)
+        normal_angles = np.arctan2(wall_set.normals[:, 1], wall_set.normals[:, 0])
+        for sign in (1.0, -1.0):
+            a, t = solve((sign * radius - side) / arc_radius, normal_angles, sign)
+            p_x = icc[:, 0, None] + arc_radius * np.cos(start_angle + a)
+            p_y = icc[:, 1, None] + arc_radius * np.sin(start_angle + a)
+            along = (p_x - wall_set.starts[:, 0]) * wall_set.units[:, 0] + \
+                    (p_y - wall_set.starts[:, 1]) * wall_set.units[:, 1]
+            valid = (along >= -1e-9) & (along <= wall_set.lengths + 1e-9)
+            times = np.where(valid, np.minimum(times, t), times)
+
+        for points in (wall_set.starts, wall_set.ends):
+            d = icc[:, None, :] - points[None]
+            d_length = np.sqrt(np.sum(d * d, axis=-1))
+            c = (radius * radius - d_length * d_length - arc_radius * arc_radius) / (2 * arc_radius * d_length)
+            _, t = solve(np.where(d_length > 0, c, np.inf), np.arctan2(d[..., 1], d[..., 0]), 1.0)
+            times = np.minimum(times, t)
+    return times
+
+
+def time_of_impact(wall_set, x, y, angle, vl, vr, l, radius, delta_time, tolerance=0.01):
+    """
+        Time at which the circles first come within tolerance of a wall along their differential drive motion.
+        The distance to a line wall along a straight line or an arc has a closed form, so the time of impact is
+        solved for exactly, see _line_impacts and _arc_impacts. A robot that already touches a wall has a time of
+        impact of 0 if it moves towards that wall, if it moves along or away from it, it is not stopped.
+        @return: the time of impact of every robot, delta_time if the robot does not hit a wall within the step
+    """
+    toi = np.full(len(x), float(delta_time))
+    # The center moves with the mean wheel speed, on the straight line as well as on the arc
+    speed = np.abs(vl + vr) / 2
+    moving = np.flatnonzero(speed > 0)
+    if len(moving) == 0 or len(wall_set) == 0:
+        return toi
+    x, y, angle, vl, vr, speed = x[moving], y[moving], angle[moving], vl[moving], vr[moving], speed[moving]
+
+    # A touched wall blocks the robot right away if the first bit of the motion brings it closer
+    dists = wall_set.distances(np.stack((x, y), axis=1))
+    a_x, a_y, _ = drive_poses(x, y, angle, vl, vr, l, np.minimum(tolerance / speed, delta_time))
+    ahead = wall_set.distances(np.stack((a_x, a_y), axis=1))
+    blocked = np.any((dists - radius < tolerance) & (ahead < dists - 1e-9), axis=1)
+
+    # Hardly turning robots drive a straight line, the arc would have a huge radius there
+    impacts = np.full(len(moving), np.inf)
+    straight = np.abs(vr - vl) / l * delta_time < 1e-6
+    if np.any(straight):
+        e_x, e_y, _ = drive_poses(x, y, angle, vl, vr, l, np.full(len(moving), float(delta_time)))
+        velocities = np.stack((e_x - x, e_y - y), axis=1)[straight] / delta_time
+        impacts[straight] = np.min(_line_impacts(wall_set, np.stack((x, y), axis=1)[straight], velocities,
+                                                 radius + tolerance), axis=1)
+    if not np.all(straight):
+        arc = ~straight
+        impacts[arc] = np.min(_arc_impacts(wall_set, x[arc], y[arc], angle[arc], vl[arc], vr[arc], l,
+                                           radius + tolerance), axis=1)
+
+    toi[moving] = np.where(blocked, 0.0, np.minimum(impacts, delta_time))
+    return toi
+
+
+def sweep_segments(wall_set, starts, ends, radius, excluded=None, tolerance=0.01):
+    """
+        Circles moving along straight segments, see _line_impacts
+        @return: the fraction of every segment that can be travelled before a wall is hit
+    """
+    s = np.ones(len(starts))
+    moving = np.flatnonzero(np.any(ends != starts, axis=1))
+    if len(moving) == 0 or len(wall_set) == 0:
+        return s
+    starts = starts[moving]
+    excluded = None if excluded is None else excluded[moving]
+
+    # Like before the time of impact, a wall that is already touched blocks the circle
+    contact = clearances(wall_set, starts, radius, excluded) < tolerance
+    impacts = _line_impacts(wall_set, starts, ends[moving] - starts, radius + tolerance)
+    if excluded is not None:
+        impacts = np.where(excluded, np.inf, impacts)
+    s[moving] = np.where(contact, 0.0, np.minimum(np.min(impacts, axis=1), 1.0))
+    return s
+
+
+def swept_collision(wall_set, x, y, angle, vl, vr, l, radius, delta_time, tolerance=0.01):
+    """
+        Continuous collision for circular differential drive robots.
+        The robots drive until the time of impact, the rest of their motion (as a straight line to the pose they
+        asked for) is projected onto the walls they touch and they slide along those walls until they hit another one.
+        @return: the new x, y and angle (within 2 pi) and the time of impact of every robot
+    """
+    x = np.asarray(x, dtype=np.float64).reshape(-1)
+    y = np.asarray(y, dtype=np.float64).reshape(-1)
+    angle = np.asarray(angle, dtype=np.float64).reshape(-1)
+    vl = np.asarray(vl, dtype=np.float64).reshape(-1)
+    vr = np.asarray(vr, dtype=np.float64).reshape(-1)
+
+    toi = time_of_impact(wall_set, x, y, angle, vl, vr, l, radius, delta_time, tolerance)
+    r_x, r_y, r_angle = drive_poses(x, y, angle, vl, vr, l, np.full(len(x), delta_time))
+    c_x, c_y, _ = drive_poses(x, y, angle, vl, vr, l, toi)
+
+    hit = np.flatnonzero(toi < delta_time)
+    if len(hit) > 0:
+        contacts = np.stack((c_x[hit], c_y[hit]), axis=1)
+        motion = np.stack((r_x[hit] - c_x[hit], r_y[hit] - c_y[hit]), axis=1)
+
+        # Normals of the touched walls, pointing from the wall to the robot
+        normals = contacts[:, None, :] - wall_set.closest_points(contacts)
+        dists = np.sqrt(np.sum(normals * normals, axis=-1))
+        touching = dists - radius < 2 * tolerance
+        normals = normals / np.where(dists > 0, dists, 1.0)[..., None]
+
+        # Remove the part of the motion that goes into a touched wall
+        for i in range(normals.shape[1]):
+            into = np.sum(motion * normals[:, i], axis=1)
+            motion -= (touching[:, i] & (into < 0))[:, None] * into[:, None] * normals[:, i]
+
+        # Sliding along a touched wall does not bring the robot closer to it, those walls can be ignored.
+        # A touched wall that is still approached blocks the slide
+        approaching = np.sum(motion[:, None, :] * normals, axis=-1) < -1e-12
+        s = sweep_segments(wall_set, contacts, contacts + motion, radius, touching & ~approaching, tolerance)
+        c_x[hit] = contacts[:, 0] + s * motion[:, 0]
+        c_y[hit] = contacts[:, 1] + s * motion[:, 1]
+
+    return c_x, c_y, r_angle % (2 * np.pi), toi
+
+
+def segment_distances(px, py, start_x, start_y, end_x, end_y):
+    """
+        Distance from the points to the segments, all arguments are broadcast against each other
+    """
+    dx = end_x - start_x
+    dy = end_y - start_y
+    length_sq = dx * dx + dy * dy
+    t = np.clip(((px - start_x) * dx + (py - start_y) * dy) / np.where(length_sq > 0, length_sq, 1.0), 0, 1)
+    dist_x = px - (start_x + t * dx)
+    dist_y = py - (start_y + t * dy)
+    return np.sqrt(dist_x * dist_x + dist_y * dist_y)
+
+
+def path_distances(px, py, x, y, angle, vl, vr, l, duration, end_x, end_y):
+    """
+        Distance from the points to the path of the robot centers: the arc (or line) the robots drive for duration,
+        followed by a straight slide to (end_x, end_y), see swept_collision. All arguments are broadcast against each
+        other
+    """
+    c_x, c_y, _ = drive_poses(x, y, angle, vl, vr, l, duration)
+    slide = segment_distances(px, py, c_x, c_y, end_x, end_y)
+
+    diff = vr - vl
+    R = l / 2 * (vl + vr) / np.where(diff != 0, diff, 0.0001)  # avoid division by zero
+    icc_x = x - R * np.sin(angle)
+    icc_y = y + R * np.cos(angle)
+    sweep = diff / l * duration
+
+    # The points within the swept angle are closest to the arc itself, the others to one of its ends
+    rel_x = px - icc_x
+    rel_y = py - icc_y
+    offset = np.mod((np.arctan2(rel_y, rel_x) - np.arctan2(y - icc_y, x - icc_x)) * np.sign(sweep), 2 * np.pi)
+    on_arc = (offset <= np.abs(sweep)) | (np.abs(sweep) >= 2 * np.pi)
+    ends = np.minimum(np.sqrt((px - x) ** 2 + (py - y) ** 2), np.sqrt((px - c_x) ** 2 + (py - c_y) ** 2))
+    arc = np.where(on_arc, np.abs(np.sqrt(rel_x * rel_x + rel_y * rel_y) - np.abs(R)), ends)
+
+    # Hardly turning robots drive a straight line, the arc would have a huge radius there
+    straight = np.abs(sweep) < 1e-6
+    arc = np.where(straight, segment_distances(px, py, x, y, c_x, c_y), arc)
+    return np.minimum(arc, slide)
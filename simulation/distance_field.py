@@ -0,0 +1,196 @@
+from simulation.line_wall import line_intersect_many
+import numpy as np
+import math
+
+
+class DistanceField:
+    """
+        Raster of the nearest wall on a grid of nodes over a static wall layout.
+        The walls are open line segments, so there is no inside or outside and the field is unsigned.
+        A query looks up the nearest walls of the 4 nodes around the point and measures the exact distance to those,
+        so its cost does not depend on the number of walls. The result never underestimates the distance and
+        overestimates it by at most bound = resolution * sqrt(2) (the nearest wall of a node at most
+        resolution / sqrt(2) away can be at most twice that distance further away than the nearest wall).
+        For circle collisions every node also lists all walls within reach + resolution / sqrt(2), so the closest node
+        of a circle with a radius of at most reach knows every wall that intercepts it, see circle_intercepts.
+    """
+    def __init__(self, wall_set, width, height, resolution=2.0, reach=None):
+        """
+            @param reach: largest circle radius of circle_intercepts, None does not list the walls for collisions
+        """
+        self.wall_set = wall_set
+        self.width = width
+        self.height = height
+        self.resolution = resolution
+        self.bound = resolution * math.sqrt(2)
+        self.reach = reach
+
+        self.n_cols = int(math.ceil(width / resolution)) + 1
+        self.n_rows = int(math.ceil(height / resolution)) + 1
+        xs = np.arange(self.n_cols) * resolution
+        ys = np.arange(self.n_rows) * resolution
+        nodes = np.stack(np.meshgrid(xs, ys), axis=-1).reshape(-1, 2)
+
+        # Rows at a time, the distance matrix of all nodes and walls at once can get large
+        nearest = np.empty(len(nodes), dtype=np.int64)
+        near = []
+        for start in range(0, len(nodes), 4096):
+            dists = wall_set.distances(nodes[start:start + 4096])
+            nearest[start:start + 4096] = np.argmin(dists, axis=1)
+            if reach is not None:
+                near.append(dists < reach + resolution / math.sqrt(2))
+        self.nearest = nearest.reshape(self.n_rows, self.n_cols)
+
+        # (n_rows, n_cols, k) walls within reach of every node, padded with -1
+        self.near = None
+        if reach is not None:
+            near = np.concatenate(near)
+            k = int(np.max(np.sum(near, axis=1)))
+            order = np.argsort(~near, axis=1, kind="stable")[:, :k]
+            near = np.where(np.take_along_axis(near, order, axis=1), order, -1)
+            self.near = near.reshape(self.n_rows, self.n_cols, k)
+
+    def candidates(self, points):
+        """
+            The nearest walls of the 4 nodes around every point, points outside the raster use the closest nodes
+            @return: (n, 4) wall indices
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        col = np.clip((points[:, 0] // self.resolution).astype(np.int64), 0, self.n_cols - 2)
+        row = np.clip((points[:, 1] // self.resolution).astype(np.int64), 0, self.n_rows - 2)
+        return np.stack((self.nearest[row, col], self.nearest[row, col + 1],
+                         self.nearest[row + 1, col], self.nearest[row + 1, col + 1]), axis=1)
+
+    def distances(self, points):
+        """
+            @return: the distance to the nearest wall (n,), the index of that wall (n,) and the closest point on it
+                     (n, 2)
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        walls = self.candidates(points)
+        closest = self.__closest_points__(points, walls)
+        delta = points[:, None, :] - closest
+        dists = np.sqrt(np.sum(delta * delta, axis=-1))
+
+        best = np.argmin(dists, axis=1)
+        rows = np.arange(len(points))
+        return dists[rows, best], walls[rows, best], closest[rows, best]
+
+    def raycast(self, ray_starts, ray_ends, max_length, tolerance=None, max_iterations=None):
+        """
+            Sphere tracing version of WallSet.raycast. Every ray marches by the guaranteed free distance, once it is
+            close to a wall the exact intersections with the candidate walls are checked.
+            Every step is at least tolerance long, by default there are enough iterations for a ray that grazes a
+            wall over its whole length. Rays that need more than max_iterations steps count as not hitting anything.
+            @return: hit points (nan if nothing was hit), distances (max_length if nothing was hit)
+                     and the index of the hit wall (-1 if nothing was hit)
+        """
+        tolerance = self.resolution / 4 if tolerance is None else tolerance
+        if max_iterations is None:
+            max_iterations = int(math.ceil(max_length / tolerance)) + 1
+        ray_ends = np.asarray(ray_ends, dtype=np.float64).reshape(-1, 2)
+        ray_starts = np.broadcast_to(np.asarray(ray_starts, dtype=np.float64).reshape(-1, 2), ray_ends.shape)
+        n_rays = len(ray_ends)
+        directions = (ray_ends - ray_starts) / max_length
+
+        hits = np.full((n_rays, 2), np.nan)
+        distances = np.full(n_rays, float(max_length))
+        wall_ids = np.full(n_rays, -1, dtype=np.int64)
+        t = np.zeros(n_rays)
+        marching = np.arange(n_rays)
+        for _ in range(max_iterations):
+            if len(marching) == 0:
+                break
+            points = ray_starts[marching] + t[marching, None] * directions[marching]
+            dists, _, _ = self.distances(points)
+
+            # Close to a wall, intersect the ray with the walls around the point
+            near = dists < self.bound + tolerance
+            if np.any(near):
+                rays = marching[near]
+                walls = self.candidates(points[near])
+                starts = self.wall_set.starts[walls]
+                ends = self.wall_set.ends[walls]
+                ray_t, _, valid = line_intersect_many(ray_starts[rays, None, :], ray_ends[rays, None, :], starts, ends)
+                ray_t = np.where(valid, ray_t * max_length, np.inf)
+                first = np.argmin(ray_t, axis=1)
+                hit_t = ray_t[np.arange(len(rays)), first]
+
+                # Only a hit close ahead is certainly the first one, the ray marched safely up to here
+                found = hit_t <= t[rays] + 2 * (self.bound + tolerance)
+                found_rays = rays[found]
+                distances[found_rays] = hit_t[found]
+                hits[found_rays] = ray_starts[found_rays] + hit_t[found, None] * directions[found_rays]
+                wall_ids[found_rays] = walls[np.arange(len(rays)), first][found]
+                t[found_rays] = np.inf
+
+            t[marching] += np.maximum(dists - self.bound, tolerance)
+            marching = marching[t[marching] < max_length]
+
+        return hits, distances, wall_ids
+
+    def circle_intercepts(self, circle_pos, radius):
+        """
+            The walls that intercept the circle, from the walls listed at the node closest to its center. That node
+            is at most resolution / sqrt(2) from the center, so it lists every wall within radius <= reach of the
+            center, also in corners where the circle intercepts walls that are not the nearest one of any node.
+            The cost only depends on the number of walls around the node. Centers outside the raster use the
+            closest node
+            @return: the indices of the intercepting walls and their (k, 2) offsets, which push the circle out of each
+                     wall along the gradient of its distance
+        """
+        if (self.reach is None) or (radius > self.reach):
+            raise ValueError(f"The field lists the walls for circles up to a radius of {self.reach}, not {radius}")
+        circle_pos = np.asarray(circle_pos, dtype=np.float64).reshape(1, 2)
+        col = int(np.clip(np.round(circle_pos[0, 0] / self.resolution), 0, self.n_cols - 1))
+        row = int(np.clip(np.round(circle_pos[0, 1] / self.resolution), 0, self.n_rows - 1))
+        walls = self.near[row, col]
+        walls = walls[walls >= 0]
+
+        dist_v = circle_pos - self.__closest_points__(circle_pos, walls[None, :])[0]
+        dist = np.sqrt(np.sum(dist_v * dist_v, axis=-1))
+        intercepts = dist < radius
+        if np.any(dist[intercepts] <= 0):
+            raise ValueError("Circle's center is exactly on the wall")
+
+        dist_v = dist_v[intercepts]
+        dist = dist[intercepts]
+        offsets = dist_v * (1 / dist)[:, None] * (radius / dist)[:, None]
+        return walls[intercepts], offsets
+
+    def error_report(self, n_samples=1000, max_length=120, seed=0):
+        """
+            Compares the distances and raycasts of the field with the exact WallSet versions at random points
+            @return: the error bound of the distances and the measured mean and max errors
+        """
+        rng = np.random.default_rng(seed)
+        points = rng.uniform((0, 0), (self.width, self.height), size=(n_samples, 2))
+        exact = np.min(self.wall_set.distances(points), axis=1)
+        dists, _, _ = self.distances(points)
+
+        angles = rng.uniform(0, 2 * np.pi, n_samples)
+        ends = points + np.stack((np.cos(angles), np.sin(angles)), axis=1) * max_length
+        _, exact_ray, exact_ids = self.wall_set.raycast(points, ends, max_length)
+        _, ray, ids = self.raycast(points, ends, max_length)
+
+        return {
+            "resolution": self.resolution,
+            "distance_bound": self.bound,
+            "distance_mean_error": float(np.mean(np.abs(dists - exact))),
+            "distance_max_error": float(np.max(np.abs(dists - exact))),
+            "raycast_mean_error": float(np.mean(np.abs(ray - exact_ray))),
+            "raycast_max_error": float(np.max(np.abs(ray - exact_ray))),
+            "raycast_wrong_wall_rate": float(np.mean(ids != exact_ids))
+        }
+
+    def __closest_points__(self, points, walls):
+        """
+            Closest point on wall walls[i, j] for every point i
+            @return: (n, k, 2) closest points
+        """
+        starts = self.wall_set.starts[walls]
+        units = self.wall_set.units[walls]
+        lengths = self.wall_set.lengths[walls]
+        proj = np.sum((points[:, None, :] - starts) * units, axis=-1)
+        proj = np.clip(proj, 0, lengths)
+        return starts + proj[..., None] * units
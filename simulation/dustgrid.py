@@ -1,3 +1,4 @@
+from simulation.continuous_collision import path_distances
 import numpy as np
 
 class DustGrid:
@@ -13,6 +14,8 @@ class DustGrid:
         
         self.cells = np.ones((height // cell_size, width // cell_size), dtype=np.bool)
         self.cleaned_cells = 0
+        # The (rows, cols) of the cells that were cleaned by the last clean call
+        self.last_cells = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
         
     def clean_circle_area(self, circle_x, circle_y, radius):
         # Calculate the area that is cleaned by the circle
@@ -29,4 +32,72 @@ class DustGrid:
         self.x_start = x_start * self.cell_size
         self.x_end = x_end * self.cell_size
         self.y_start = y_start * self.cell_size
-        self.y_end = y_end * self.cell_size
\ No newline at end of file
+        self.y_end = y_end * self.cell_size
+
+        rows, cols = np.meshgrid(np.arange(max(y_start, 0), max(y_end, 0)), np.arange(max(x_start, 0), max(x_end, 0)),
+                                 indexing="ij")
+        self.last_cells = (rows.reshape(-1), cols.reshape(-1))
+
+    def clean_capsule_area(self, start_x, start_y, end_x, end_y, radius):
+        """
+            Cleans every cell whose center is within radius of the path from start to end, the area swept by a circle
+            that moves from start to end
+        """
+        # Only look at the cells in the bounding box of the capsule
+        n_rows, n_cols = self.cells.shape
+        x_start = max(int((min(start_x, end_x) - radius) // self.cell_size), 0)
+        x_end = min(int((max(start_x, end_x) + radius) // self.cell_size + 1), n_cols)
+        y_start = max(int((min(start_y, end_y) - radius) // self.cell_size), 0)
+        y_end = min(int((max(start_y, end_y) + radius) // self.cell_size + 1), n_rows)
+        if (x_end <= x_start) or (y_end <= y_start):
+            self.last_cells = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+            return
+
+        rows, cols = np.meshgrid(np.arange(y_start, y_end), np.arange(x_start, x_end), indexing="ij")
+        center_x = (cols + 0.5) * self.cell_size
+        center_y = (rows + 0.5) * self.cell_size
+
+        # Distance from the cell centers to the path of the circle center
+        dx = end_x - start_x
+        dy = end_y - start_y
+        length_sq = dx * dx + dy * dy
+        t = ((center_x - start_x) * dx + (center_y - start_y) * dy) / length_sq if length_sq > 0 else 0.0
+        t = np.clip(t, 0, 1)
+        dist_x = center_x - (start_x + t * dx)
+        dist_y = center_y - (start_y + t * dy)
+        inside = dist_x * dist_x + dist_y * dist_y <= radius * radius
+
+        # Clean area
+        rows = rows[inside]
+        cols = cols[inside]
+        self.cleaned_cells += np.sum(self.cells[rows, cols])
+        self.cells[rows, cols] = 0
+        self.last_cells = (rows, cols)
+
+    def clean_path_area(self, x, y, angle, vl, vr, l, duration, end_x, end_y, radius):
+        """
+            Cleans every cell whose center is within radius of the path of a differential drive robot: the arc it drives
+            from (x, y, angle) for duration, followed by a straight slide to (end_x, end_y), see path_distances
+        """
+        # The arc is never further from its start than the distance the robot drives
+        reach = abs(vl + vr) / 2 * duration
+        n_rows, n_cols = self.cells.shape
+        x_start = max(int((min(x - reach, end_x) - radius) // self.cell_size), 0)
+        x_end = min(int((max(x + reach, end_x) + radius) // self.cell_size + 1), n_cols)
+        y_start = max(int((min(y - reach, end_y) - radius) // self.cell_size), 0)
+        y_end = min(int((max(y + reach, end_y) + radius) // self.cell_size + 1), n_rows)
+        if (x_end <= x_start) or (y_end <= y_start):
+            self.last_cells = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+            return
+
+        rows, cols = np.meshgrid(np.arange(y_start, y_end), np.arange(x_start, x_end), indexing="ij")
+        center_x = (cols + 0.5) * self.cell_size
+        center_y = (rows + 0.5) * self.cell_size
+        inside = path_distances(center_x, center_y, x, y, angle, vl, vr, l, duration, end_x, end_y) <= radius
+
+        # Clean area
+        rows = rows[inside]
+        cols = cols[inside]
+        self.cleaned_cells += np.sum(self.cells[rows, cols])
+        self.cells[rows, cols] = 0
+        self.last_cells = (rows, cols)
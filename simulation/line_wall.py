@@ -124,6 +124,222 @@ class LineWall:
 
         return inter, distance, closest_line
 
+class WallSet:
+    """
+        All wall segments of a world stored as contiguous float64 arrays, so the geometric queries can be done for
+        all walls at once instead of building Vector2 temporaries per wall
+    """
+    def __init__(self, starts, ends):
+        self.starts = np.ascontiguousarray(starts, dtype=np.float64).reshape(-1, 2)
+        self.ends = np.ascontiguousarray(ends, dtype=np.float64).reshape(-1, 2)
+        if np.any(np.all(self.starts == self.ends, axis=1)):
+            raise ValueError("Invalid segment length")
+
+        self.directions = self.ends - self.starts
+        self.lengths = np.sqrt(np.sum(self.directions * self.directions, axis=1))
+        self.units = self.directions / self.lengths[:, None]
+        # Rotated by 90 degrees, the same side as the normal_point in calculate_sliding
+        self.normals = np.stack((-self.units[:, 1], self.units[:, 0]), axis=1)
+
+        self.__line_walls__ = None
+
+    @staticmethod
+    def from_line_walls(walls):
+        starts = [(wall.start.x, wall.start.y) for wall in walls]
+        ends = [(wall.end.x, wall.end.y) for wall in walls]
+        return WallSet(starts, ends)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, index):
+        return self.line_walls()[index]
+
+    def line_walls(self):
+        """
+            LineWall views of the segments, these are only meant for drawing and the per wall legacy methods
+        """
+        if self.__line_walls__ is None:
+            self.__line_walls__ = [LineWall(tuple(start), tuple(end)) for start, end in zip(self.starts, self.ends)]
+        return self.__line_walls__
+
+    def intersect_segments(self, line_starts, line_ends, indices=None):
+        """
+            Intersects segments with the walls
+            @param line_starts: (n, 2) starts of the segments
+            @param line_ends: (n, 2) ends of the segments
+            @param indices: only intersect with these walls, all walls if None
+            @return: (n, m) t along the segments, u along the walls and the valid mask
+        """
+        starts, ends = self.__select__(indices)
+        line_starts = np.asarray(line_starts, dtype=np.float64).reshape(-1, 1, 2)
+        line_ends = np.asarray(line_ends, dtype=np.float64).reshape(-1, 1, 2)
+        return line_intersect_many(line_starts, line_ends, starts[None, :, :], ends[None, :, :])
+
+    def raycast(self, ray_starts, ray_ends, max_length, indices=None):
+        """
+            Finds the closest wall hit by every ray
+            @param ray_starts: (n, 2) ray starts
+            @param ray_ends: (n, 2) ray ends
+            @param max_length: only hits closer than max_length count
+            @param indices: only intersect with these walls, all walls if None
+            @return: hit points (nan if nothing was hit), distances (max_length if nothing was hit)
+                     and the index of the hit wall (-1 if nothing was hit)
+        """
+        ray_starts = np.asarray(ray_starts, dtype=np.float64).reshape(-1, 2)
+        ray_ends = np.asarray(ray_ends, dtype=np.float64).reshape(-1, 2)
+        ray_starts = np.broadcast_to(ray_starts, ray_ends.shape)
+        n_rays = len(ray_ends)
+
+        hits = np.full((n_rays, 2), np.nan)
+        distances = np.full(n_rays, float(max_length))
+        wall_ids = np.full(n_rays, -1, dtype=np.int64)
+        n_walls = len(self) if indices is None else len(indices)
+        if n_walls == 0 or n_rays == 0:
+            return hits, distances, wall_ids
+
+        # Rays along the first axis, walls along the second
+        t, _, valid = self.intersect_segments(ray_starts, ray_ends, indices)
+        inters = ray_starts[:, None, :] + t[..., None] * (ray_ends - ray_starts)[:, None, :]
+        delta = inters - ray_starts[:, None, :]
+        dists = np.sqrt(delta[..., 0] * delta[..., 0] + delta[..., 1] * delta[..., 1])
+
+        # Only intersections that are closer than max_length count, the first closest wall wins
+        dists = np.where(valid & (dists < max_length), dists, np.inf)
+        closest = np.argmin(dists, axis=1)
+        rays = np.arange(n_rays)
+        hit = np.isfinite(dists[rays, closest])
+
+        hits[hit] = inters[rays[hit], closest[hit]]
+        distances[hit] = dists[rays[hit], closest[hit]]
+        wall_ids[hit] = closest[hit] if indices is None else np.asarray(indices)[closest[hit]]
+        return hits, distances, wall_ids
+
+    def closest_points(self, points, indices=None):
+        """
+            Finds the closest point on every wall for every point
+            @param points: (n, 2) points
+            @param indices: only use these walls, all walls if None
+            @return: (n, m, 2) closest points
+        """
+        starts, ends = self.__select__(indices)
+        units = self.units if indices is None else self.units[indices]
+        lengths = self.lengths if indices is None else self.lengths[indices]
+
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 1, 2)
+        proj = np.sum((points - starts[None, :, :]) * units[None, :, :], axis=-1)
+        closest = starts[None, :, :] + proj[..., None] * units[None, :, :]
+        closest = np.where((proj <= 0)[..., None], starts[None, :, :], closest)
+        closest = np.where((proj >= lengths[None, :])[..., None], ends[None, :, :], closest)
+        return closest
+
+    def circle_intercepts(self, circle_pos, radius, indices=None):
+        """
+            Vectorized check_circle_intercept for a single circle
+            @return: mask of the intercepting walls and the (m, 2) offsets, which are only valid where the mask is set
+        """
+        circle_pos = np.asarray(circle_pos, dtype=np.float64).reshape(2)
+        dist_v = circle_pos - self.closest_points(circle_pos, indices)[0]
+        dist = np.sqrt(np.sum(dist_v * dist_v, axis=-1))
+        intercepts = dist < radius
+        if np.any(dist[intercepts] <= 0):
+            raise ValueError("Circle's center is exactly on the wall")
+
+        safe_dist = np.where(intercepts, dist, 1.0)
+        offsets = dist_v * (1 / safe_dist)[:, None] * (radius / safe_dist)[:, None]
+        return intercepts, offsets
+
+    def distances(self, points, indices=None):
+        """
+            Distance from every point to every wall
+            @param points: (n, 2) points
+            @return: (n, m) distances
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 1, 2)
+        delta = points - self.closest_points(points, indices)
+        return np.sqrt(np.sum(delta * delta, axis=-1))
+
+    def segment_distances(self, line_starts, line_ends, indices=None):
+        """
+            Distance from every segment to every wall, 0 if they intersect
+            @param line_starts: (n, 2) starts of the segments
+            @param line_ends: (n, 2) ends of the segments
+            @return: (n, m) distances
+        """
+        line_starts = np.asarray(line_starts, dtype=np.float64).reshape(-1, 2)
+        line_ends = np.asarray(line_ends, dtype=np.float64).reshape(-1, 2)
+        starts, ends = self.__select__(indices)
+        _, _, valid = self.intersect_segments(line_starts, line_ends, indices)
+
+        # Without an intersection the closest pair of points has an end point of one of the segments
+        dists = np.minimum(self.distances(line_starts, indices), self.distances(line_ends, indices))
+        segments = WallSet(line_starts, line_ends)
+        dists = np.minimum(dists, segments.distances(starts).T)
+        dists = np.minimum(dists, segments.distances(ends).T)
+        return np.where(valid, 0.0, dists)
+
+    def slide_locations(self, circle_positions, radius, indices=None):
+        """
+            Vectorized calculate_sliding, the slide location of every circle for every wall
+            @param circle_positions: (n, 2) requested circle positions
+            @return: (n, m, 2) slide locations, nan where no slide location exists
+        """
+        buffer = 1e-13
+        circle_pos = np.asarray(circle_positions, dtype=np.float64).reshape(-1, 1, 2)
+        starts, ends = self.__select__(indices)
+        directions = self.directions if indices is None else self.directions[indices]
+        lengths = self.lengths if indices is None else self.lengths[indices]
+        dx = directions[:, 0]
+        dy = directions[:, 1]
+
+        # The lines from circle_pos to the normal points are tangent to the wall
+        normal_points = np.stack((circle_pos[..., 0] - dy, circle_pos[..., 1] + dx), axis=-1)
+        other_normal_points = np.stack((circle_pos[..., 0] + dy, circle_pos[..., 1] - dx), axis=-1)
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            t, _, valid = line_intersect_many(circle_pos, normal_points, starts, ends)
+            t_other, _, valid_other = line_intersect_many(circle_pos, other_normal_points, starts, ends)
+            t = np.where(valid, t, t_other)
+            normal_inter = circle_pos + t[..., None] * np.where(valid[..., None], normal_points - circle_pos,
+                                                                other_normal_points - circle_pos)
+            on_segment = valid | valid_other
+
+            # Extend the line from the requested circle location through the intersect of the normal line
+            # Note: Vector2 divides by multiplying with the reciprocal, do the same to get identical results
+            v = normal_inter - circle_pos
+            u = v * (1 / np.sqrt(np.sum(v * v, axis=-1)))[..., None]
+            slides = normal_inter - (radius + buffer) * u
+
+            # The normal line does not intersect with the line, we are on an endpoint.
+            # Extend both the segments with the radius for the pole case
+            su = directions * (1 / lengths)[:, None]
+            seg_end_ext = ends + su * radius
+            seg_start_ext = starts - su * radius
+            t, _, valid = line_intersect_many(seg_start_ext, seg_end_ext, circle_pos, normal_points)
+            t_other, _, valid_other = line_intersect_many(seg_start_ext, seg_end_ext, circle_pos, other_normal_points)
+            t = np.where(valid, t, t_other)
+            pole_inter = seg_start_ext + t[..., None] * (seg_end_ext - seg_start_ext)
+            pole_inter[~(valid | valid_other)] = np.nan
+
+            # Find the closest endpoint to the intersect
+            to_start = np.sqrt(np.sum((starts - pole_inter) ** 2, axis=-1))
+            to_end = np.sqrt(np.sum((ends - pole_inter) ** 2, axis=-1))
+            closest_dist = np.where(to_start <= to_end, to_start, to_end)
+
+            # Calculate the distance from the intersect point of the pole case using some trigonometry
+            dist_from_inter = np.sqrt(radius ** 2 - closest_dist ** 2)
+            v = pole_inter - circle_pos
+            u = v * (1 / np.sqrt(np.sum(v * v, axis=-1)))[..., None]
+            pole_slides = pole_inter - (dist_from_inter + buffer)[..., None] * u
+
+        return np.where(on_segment[..., None], slides, pole_slides)
+
+    def __select__(self, indices):
+        if indices is None:
+            return self.starts, self.ends
+        return self.starts[indices], self.ends[indices]
+
+
 def euclid_distance(a, b):
     """
     @param a: point 1
@@ -161,3 +377,27 @@ def line_intersect(a1, a2, b1, b2):
 
     intersection = a1 + t * b
     return intersection
+
+def line_intersect_many(a1, a2, b1, b2):
+    """
+    Vectorized version of line_intersect, all arguments are broadcast against each other
+    @param a1: (..., 2) starts of the first lines
+    @param a2: (..., 2) ends of the first lines
+    @param b1: (..., 2) starts of the second lines
+    @param b2: (..., 2) ends of the second lines
+    @return: t along the first lines, u along the second lines and a mask of the valid intersections
+    """
+    b = a2 - a1
+    d = b2 - b1
+    b_dot_d_perp = b[..., 0] * d[..., 1] - b[..., 1] * d[..., 0]
+
+    # Lines are parallel, aka no intersection
+    parallel = b_dot_d_perp == 0
+    denominator = np.where(parallel, 1.0, b_dot_d_perp)
+
+    c = b1 - a1
+    t = (c[..., 0] * d[..., 1] - c[..., 1] * d[..., 0]) / denominator
+    u = (c[..., 0] * b[..., 1] - c[..., 1] * b[..., 0]) / denominator
+
+    valid = ~parallel & (t >= 0) & (t <= 1) & (u >= 0) & (u <= 1)
+    return t, u, valid
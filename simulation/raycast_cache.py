@@ -0,0 +1,98 @@
+from simulation.line_wall import line_intersect_many
+import numpy as np
+import math
+
+
+class RaycastCache:
+    """
+        Candidate walls per sensor ray of one robot, reused between steps.
+        Every ray remembers the walls within margin of the ray it was built for. After the robot moved by d and turned
+        by a, every point of a ray moved by at most d + max_length * |a|, as long as that is smaller than the margin a
+        wall the ray hits now was within margin of the old ray, so only the candidates have to be tested.
+    """
+    def __init__(self, margin=30.0):
+        self.margin = margin
+        self.x = None
+        self.y = None
+        self.angles = None
+        self.max_length = None
+        # (n_rays, k) candidate wall indices, padded with -1
+        self.candidates = None
+
+        self.hits = 0
+        self.misses = 0
+        self.walls_tested = 0
+        self.walls_total = 0
+
+    def valid(self, x, y, angles, max_length):
+        """
+            Whether the candidates still cover the rays from (x, y) with these angles
+        """
+        if (self.candidates is None) or (max_length != self.max_length) or (len(angles) != len(self.angles)):
+            return False
+        displacement = math.sqrt((x - self.x) ** 2 + (y - self.y) ** 2)
+        rotation = np.max(np.abs((angles - self.angles + math.pi) % (2 * math.pi) - math.pi))
+        return displacement + max_length * rotation < self.margin
+
+    def raycast(self, wall_set, x, y, angles, max_length):
+        """
+            Casts a ray for every angle from (x, y), like WallSet.raycast but only against the candidates of every ray.
+            The candidates are rebuilt if the robot moved too far since they were built
+            @return: hit points (nan if nothing was hit), distances (max_length if nothing was hit)
+                     and the index of the hit wall (-1 if nothing was hit)
+        """
+        angles = np.asarray(angles, dtype=np.float64).reshape(-1)
+        start = np.array([x, y], dtype=np.float64)
+        directions = np.stack((np.cos(angles), np.sin(angles)), axis=-1)
+        ends = start + directions * max_length
+
+        if self.valid(x, y, angles, max_length):
+            self.hits += 1
+        else:
+            self.misses += 1
+            self.__rebuild__(wall_set, start, ends, angles, max_length)
+
+        n_rays = len(angles)
+        hits = np.full((n_rays, 2), np.nan)
+        distances = np.full(n_rays, float(max_length))
+        wall_ids = np.full(n_rays, -1, dtype=np.int64)
+        self.walls_tested += int(np.sum(self.candidates >= 0))
+        self.walls_total += n_rays * len(wall_set)
+        if self.candidates.shape[1] == 0:
+            return hits, distances, wall_ids
+
+        # Same arithmetic as WallSet.raycast, so the results do not depend on the cache
+        walls = np.maximum(self.candidates, 0)
+        t, _, valid = line_intersect_many(start, ends[:, None, :], wall_set.starts[walls], wall_set.ends[walls])
+        inters = start + t[..., None] * (ends - start)[:, None, :]
+        delta = inters - start
+        dists = np.sqrt(delta[..., 0] * delta[..., 0] + delta[..., 1] * delta[..., 1])
+        dists = np.where(valid & (self.candidates >= 0) & (dists < max_length), dists, np.inf)
+
+        closest = np.argmin(dists, axis=1)
+        rays = np.arange(n_rays)
+        hit = np.isfinite(dists[rays, closest])
+        hits[hit] = inters[rays[hit], closest[hit]]
+        distances[hit] = dists[rays[hit], closest[hit]]
+        wall_ids[hit] = self.candidates[rays[hit], closest[hit]]
+        return hits, distances, wall_ids
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total > 0 else 0.0,
+            "tested_fraction": self.walls_tested / self.walls_total if self.walls_total > 0 else 0.0
+        }
+
+    def __rebuild__(self, wall_set, start, ends, angles, max_length):
+        near = wall_set.segment_distances(np.broadcast_to(start, ends.shape), ends) < self.margin
+        k = int(np.max(np.sum(near, axis=1))) if len(near) > 0 else 0
+
+        # Candidates first, then padding
+        order = np.argsort(~near, axis=1, kind="stable")[:, :k]
+        self.candidates = np.where(np.take_along_axis(near, order, axis=1), order, -1)
+        self.x, self.y = float(start[0]), float(start[1])
+        self.angles = angles.copy()
+        self.max_length = max_length
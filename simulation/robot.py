@@ -1,6 +1,9 @@
 import numpy as np
 import math
+from pygame.math import Vector2
 from simulation.kf_localizer import KFLocalizer
+from simulation.continuous_collision import swept_collision
+from simulation.raycast_cache import RaycastCache
 
 def vel_motion_model(state, action, delta_time, insert_noise=False):
     x, y, angle = state
@@ -40,14 +43,20 @@ def triangulate(x1, y1, r1, x2, y2, r2, x3, y3, r3):
 
 class Robot:
     def __init__(self, start_x, start_y, start_angle, scenario, collision, radius=20,
-                 max_v=100, v_step=10, n_sensors=12, max_sensor_length=100, omni_sensor_range=150):
+                 max_v=100, v_step=10, n_sensors=12, max_sensor_length=100, omni_sensor_range=150,
+                 continuous_collision=False, ray_cache_margin=None, sensor_period=0.0):
         self.x = start_x
         self.y = start_y
         self.scenario = scenario
         self.collision = collision
+        # Sweep the robot along its motion instead of only checking the end position, so large steps can not tunnel
+        # through walls (diff_drive only)
+        self.continuous_collision = continuous_collision
         self.radius = radius
         self.max_v = max_v
         self.angle = start_angle  # In radians
+        # Simulated time, the sensor data is stamped with it
+        self.time = 0.0
 
         if scenario == "evolutionary":
             self.motion_model = "diff_drive"
@@ -69,6 +78,14 @@ class Robot:
             self.n_sensors = n_sensors  # The amount of sensors used for collecting environment data
             self.max_sensor_length = max_sensor_length
             self.sensor_data = []
+            # Seconds between scheduled sensor readings, 0 senses on every update and None only on request,
+            # see get_sensor_data
+            self.sensor_period = sensor_period
+            # Time and position at which sensor_data was collected, None if the robot did not sense yet
+            self.sensor_time = None
+            self.sensor_origin = None
+            # Reuse the candidate walls of the sensor rays while the robot stays within the margin, see RaycastCache
+            self.ray_cache = RaycastCache(ray_cache_margin) if ray_cache_margin is not None else None
 
             self.l = 2 * self.radius
             self.vl = 0
@@ -206,6 +223,7 @@ class Robot:
         return vel_motion_model(state, action, delta_time)
 
     def update(self, delta_time):
+        self.time += delta_time
         if self.motion_model == "diff_drive":
             r_x, r_y, r_angle = self.differential_drive(delta_time)
         elif self.motion_model == "vel_drive":
@@ -218,15 +236,19 @@ class Robot:
         # Save the x and y for the speed calculation
         x_tmp = self.x
         y_tmp = self.y
+        # Time the robot drove along its arc before it touched a wall, only known with continuous collision
+        self.time_of_impact = delta_time
 
-        if self.collision:
+        if self.collision and self.continuous_collision and (self.motion_model == "diff_drive"):
+            self.check_continuous_collision(delta_time)
+        elif self.collision:
             self.check_collision(r_x, r_y, r_angle)
         else:
             self.x = r_x
             self.y = r_y
             self.angle = r_angle
 
-        if self.motion_model == "diff_drive":
+        if (self.motion_model == "diff_drive") and self.sensors_due():
             self.collect_sensor_data()
 
         if self.scenario == "localization":
@@ -262,6 +284,17 @@ class Robot:
 
         self.angle = r_angle
 
+    def check_continuous_collision(self, delta_time):
+        """
+            Drives along the arc until the robot hits a wall and slides along the wall for the rest of the step
+        """
+        x, y, angle, toi = swept_collision(self.world.wall_set, self.x, self.y, self.angle, self.vl, self.vr, self.l,
+                                           self.radius, delta_time)
+        self.time_of_impact = float(toi[0])
+        self.x = float(x[0])
+        self.y = float(y[0])
+        self.angle = float(angle[0])
+
     def scan_for_beacons(self):
         beacons_in_range = self.world.get_beacons(self.x, self.y, self.omni_sensor_range)
 
@@ -303,18 +336,42 @@ class Robot:
         angle = math.atan2(-1 * (self.beacons[0][0].y - y), self.beacons[0][0].x - x) - f[0][1]
         return x, y, angle
 
+    def sensors_due(self):
+        """
+            Whether the sensor schedule asks for a new reading
+        """
+        if self.sensor_period is None:
+            return False
+        # Small tolerance so summed up time steps do not skip a reading
+        return (self.sensor_time is None) or (self.time - self.sensor_time >= self.sensor_period - 1e-9)
+
+    def sensor_age(self):
+        """
+            @return: seconds since the sensor data was collected, inf if the robot did not sense yet
+        """
+        return math.inf if self.sensor_time is None else self.time - self.sensor_time
+
+    def get_sensor_data(self, max_age=0.0):
+        """
+            The sensor data, collected first if it is older than max_age seconds
+        """
+        if self.sensor_age() > max_age:
+            self.collect_sensor_data()
+        return self.sensor_data
+
     def collect_sensor_data(self):
         raycast_length = self.radius + self.max_sensor_length
         delta_angle = (math.pi * 2) / self.n_sensors
 
+        # Note the sensor angles are relative to our own angle
+        # Note instead of calculating the position of the sensors
+        # We just send the raycasts from the center of our agent
+        sensor_angles = self.angle + delta_angle * np.arange(self.n_sensors)
+        hits, dists, _ = self.world.raycast_many(self.x, self.y, sensor_angles, raycast_length, self.ray_cache)
+
+        self.sensor_time = self.time
+        self.sensor_origin = (self.x, self.y)
         self.sensor_data = []
-        for sensor_id in range(self.n_sensors):
-            # Note the sensor angle is relative to our own angle
-            sensor_angle = self.angle + delta_angle * sensor_id
-
-            # Note instead of calculating the position of the sensor
-            # We just send a raycast from the center of our agent
-            hit, dist, line = self.world.raycast(self.x, self.y, sensor_angle,
-                                                 raycast_length)
-            dist -= self.radius
-            self.sensor_data.append((hit, dist))
+        for hit, dist in zip(hits, dists):
+            hit = Vector2(*hit) if not np.isnan(hit[0]) else None
+            self.sensor_data.append((hit, float(dist) - self.radius))
@@ -0,0 +1,159 @@
+import numpy as np
+import hashlib
+import math
+import os
+
+# Bump when the layout of the table files changes, old files are then not used anymore
+TABLE_VERSION = 1
+
+
+class SensorTable:
+    """
+        Precomputed raycast distances of a static wall layout on a (y, x, angle) grid.
+        Sensing becomes a trilinear interpolation of the 8 table entries around the pose of the ray, so its cost does
+        not depend on the walls at all. The table is stored as a memory mapped .npy file in cache_dir, keyed by a hash
+        of the wall geometry and the grid, so every process and every later run with the same layout maps that file.
+        The distances are exact at the grid nodes, in between they are interpolated. This goes wrong for points closer
+        to a wall than about a node distance (the nodes behind the wall see it right in front of them) and for rays
+        that graze a corner, see error_report for the error at a given resolution.
+    """
+    def __init__(self, wall_set, width, height, max_length, resolution=4.0, n_angles=360, cache_dir=None):
+        """
+            @param max_length: length of the rays, longer rays can not be looked up
+            @param resolution: distance between the grid nodes in x and y
+            @param n_angles: number of ray angles per node
+            @param cache_dir: directory of the table files, None keeps the table in memory only
+        """
+        self.wall_set = wall_set
+        self.width = width
+        self.height = height
+        self.max_length = float(max_length)
+        self.resolution = resolution
+        self.n_angles = n_angles
+        self.delta_angle = (math.pi * 2) / n_angles
+        self.n_cols = int(math.ceil(width / resolution)) + 1
+        self.n_rows = int(math.ceil(height / resolution)) + 1
+        self.loaded = False
+
+        if cache_dir is None:
+            self.path = None
+            self.table = np.empty((self.n_rows, self.n_cols, n_angles), dtype=np.float32)
+            self.__fill__(self.table)
+            return
+
+        self.path = os.path.join(cache_dir, f"sensor_table_{self.key()}.npy")
+        if os.path.exists(self.path):
+            self.loaded = True
+        else:
+            os.makedirs(cache_dir, exist_ok=True)
+            # Build into a temporary file first, other processes only ever see complete tables
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            table = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.float32,
+                                              shape=(self.n_rows, self.n_cols, n_angles))
+            self.__fill__(table)
+            table.flush()
+            del table
+            os.replace(tmp_path, self.path)
+        self.table = np.load(self.path, mmap_mode="r")
+
+    def key(self):
+        """
+            Hash of the wall geometry and the grid, tables with the same key are interchangeable
+        """
+        key = hashlib.sha1()
+        key.update(np.ascontiguousarray(self.wall_set.starts, dtype=np.float64).tobytes())
+        key.update(np.ascontiguousarray(self.wall_set.ends, dtype=np.float64).tobytes())
+        key.update(str((TABLE_VERSION, self.width, self.height, self.max_length, self.resolution,
+                        self.n_angles)).encode())
+        return key.hexdigest()
+
+    def lookup(self, points, angles):
+        """
+            Interpolated distance of the ray from every point in the direction of its angle
+            @param points: (n, 2) ray starts
+            @param angles: (n,) ray angles in radians
+            @return: (n,) distances, max_length if nothing is hit
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        angles = np.asarray(angles, dtype=np.float64).reshape(-1)
+
+        f_x = np.clip(points[:, 0] / self.resolution, 0, self.n_cols - 1)
+        f_y = np.clip(points[:, 1] / self.resolution, 0, self.n_rows - 1)
+        f_a = np.mod(angles, math.pi * 2) / self.delta_angle
+        col = np.minimum(f_x.astype(np.int64), self.n_cols - 2)
+        row = np.minimum(f_y.astype(np.int64), self.n_rows - 2)
+        a0 = np.minimum(f_a.astype(np.int64), self.n_angles - 1)
+        a1 = (a0 + 1) % self.n_angles
+        w_x = f_x - col
+        w_y = f_y - row
+        w_a = f_a - a0
+
+        # Interpolate along the angle at the 4 nodes around the point, then between the nodes
+        values = []
+        for d_row, d_col in ((0, 0), (0, 1), (1, 0), (1, 1)):
+            v0 = self.table[row + d_row, col + d_col, a0]
+            v1 = self.table[row + d_row, col + d_col, a1]
+            values.append(v0 + w_a * (v1 - v0))
+        bottom = values[0] + w_x * (values[1] - values[0])
+        top = values[2] + w_x * (values[3] - values[2])
+        return bottom + w_y * (top - bottom)
+
+    def raycast(self, ray_starts, ray_ends, max_length):
+        """
+            Table version of WallSet.raycast. The table only knows distances, so the wall indices are always -1
+            @return: hit points (nan if nothing was hit), distances (max_length if nothing was hit)
+                     and the index of the hit wall (-1)
+        """
+        if max_length > self.max_length:
+            raise ValueError(f"The table only has rays up to {self.max_length}, not {max_length}")
+        ray_ends = np.asarray(ray_ends, dtype=np.float64).reshape(-1, 2)
+        ray_starts = np.broadcast_to(np.asarray(ray_starts, dtype=np.float64).reshape(-1, 2), ray_ends.shape)
+        directions = (ray_ends - ray_starts) / max_length
+
+        distances = np.minimum(self.lookup(ray_starts, np.arctan2(directions[:, 1], directions[:, 0])), max_length)
+        hit = distances < max_length
+        hits = np.where(hit[:, None], ray_starts + distances[:, None] * directions, np.nan)
+        return hits, distances, np.full(len(ray_ends), -1, dtype=np.int64)
+
+    def error_report(self, n_samples=1000, min_clearance=0.0, seed=0):
+        """
+            Compares the interpolated distances with exact raycasts from random poses
+            @param min_clearance: only poses at least this far from the walls, like the center of a robot
+            @return: the mean, 95th percentile, 99th percentile and max errors
+        """
+        rng = np.random.default_rng(seed)
+        points = np.empty((0, 2))
+        while len(points) < n_samples:
+            samples = rng.uniform((0, 0), (self.width, self.height), size=(n_samples, 2))
+            clear = np.min(self.wall_set.distances(samples), axis=1) >= min_clearance
+            points = np.concatenate((points, samples[clear]))[:n_samples]
+        angles = rng.uniform(0, 2 * np.pi, n_samples)
+        ends = points + np.stack((np.cos(angles), np.sin(angles)), axis=1) * self.max_length
+        _, exact, _ = self.wall_set.raycast(points, ends, self.max_length)
+        errors = np.abs(self.lookup(points, angles) - exact)
+
+        return {
+            "resolution": self.resolution,
+            "n_angles": self.n_angles,
+            "mean_error": float(np.mean(errors)),
+            "p95_error": float(np.percentile(errors, 95)),
+            "p99_error": float(np.percentile(errors, 99)),
+            "max_error": float(np.max(errors))
+        }
+
+    def __fill__(self, table):
+        """
+            Casts the rays of all grid nodes, a few rows at a time to keep the ray and wall matrix small
+        """
+        angles = np.arange(self.n_angles) * self.delta_angle
+        directions = np.stack((np.cos(angles), np.sin(angles)), axis=1)
+        xs = np.arange(self.n_cols) * self.resolution
+        rows_per_chunk = max(1, 200000 // (self.n_cols * self.n_angles))
+
+        for start in range(0, self.n_rows, rows_per_chunk):
+            rows = np.arange(start, min(start + rows_per_chunk, self.n_rows))
+            nodes = np.stack(np.meshgrid(xs, rows * self.resolution), axis=-1).reshape(-1, 2)
+            starts = np.repeat(nodes, self.n_angles, axis=0)
+            ends = starts + np.tile(directions, (len(nodes), 1)) * self.max_length
+            _, dists, _ = self.wall_set.raycast(starts, ends, self.max_length)
+            table[rows] = dists.reshape(len(rows), self.n_cols, self.n_angles)
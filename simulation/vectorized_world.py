@@ -0,0 +1,293 @@
+from simulation.line_wall import WallSet
+from simulation.continuous_collision import swept_collision, path_distances
+import numpy as np
+import math
+
+
+class VectorizedWorld:
+    """
+        Simulates N independent differential drive robots in the same static wall layout.
+        The robots do not see or collide with each other, every robot has its own dust grid.
+        All state is kept in arrays of length N, so one update steps all robots at once.
+    """
+    def __init__(self, walls, width, height, n_robots, radius=20, max_v=100, n_sensors=12, max_sensor_length=100,
+                 collision=True, cell_size=5, continuous_collision=False, swept_coverage=False, distance_field=None,
+                 sensor_table=None, event_driven=False):
+        assert width % cell_size == 0, "The width has to be divisible by cell_size"
+        assert height % cell_size == 0, "The height has to be divisible by cell_size"
+
+        self.wall_set = walls if isinstance(walls, WallSet) else WallSet.from_line_walls(walls)
+        self.width = width
+        self.height = height
+        self.n_robots = n_robots
+        self.radius = radius
+        self.max_v = max_v
+        self.n_sensors = n_sensors
+        self.max_sensor_length = max_sensor_length
+        self.collision = collision
+        self.continuous_collision = continuous_collision
+        self.swept_coverage = swept_coverage
+        # Drive every robot analytically along its arc to the end of the step or its first wall contact (continuous
+        # collision) and clean exactly along the driven path, so a step can span a whole controller tick. After a
+        # contact the robot does not follow its arc anymore, it slides in a straight line along the wall towards the
+        # pose it asked for for the rest of the step, see swept_collision
+        self.event_driven = event_driven
+        # Number of wall contacts within the steps. Robots that slide along or move away from a wall they touch do not
+        # count, see time_of_impact
+        self.contact_events = 0
+        # Raster backend for the sensors, see DistanceField
+        self.distance_field = distance_field
+        # Precomputed sensor distances, replaces the raycasts of the sensors if given, see SensorTable
+        self.sensor_table = sensor_table
+        self.cell_size = cell_size
+        self.l = 2 * radius
+
+        # Robot state
+        self.x = np.zeros(n_robots)
+        self.y = np.zeros(n_robots)
+        self.angle = np.zeros(n_robots)
+        self.vl = np.zeros(n_robots)
+        self.vr = np.zeros(n_robots)
+        self.sensor_data = np.zeros((n_robots, n_sensors))
+
+        # Coverage state, one dust grid per robot
+        self.cells = np.ones((n_robots, height // cell_size, width // cell_size), dtype=bool)
+        self.cleaned_cells = np.zeros(n_robots, dtype=np.int64)
+
+    def set_robots(self, x, y, angle):
+        """
+            Places the robots and resets their velocities, sensors and dust grids
+        """
+        self.x = np.array(x, dtype=np.float64).reshape(self.n_robots)
+        self.y = np.array(y, dtype=np.float64).reshape(self.n_robots)
+        self.angle = np.array(angle, dtype=np.float64).reshape(self.n_robots)
+        self.vl[:] = 0
+        self.vr[:] = 0
+        self.sensor_data[:] = 0
+        self.cells[:] = True
+        self.cleaned_cells[:] = 0
+
+    def update(self, delta_time, active=None):
+        """
+            Steps all robots, only the robots in the active mask move, sense and clean
+        """
+        active = np.ones(self.n_robots, dtype=bool) if active is None else active
+        prev_x = self.x
+        prev_y = self.y
+        prev_angle = self.angle
+        toi = np.full(self.n_robots, float(delta_time))
+        if self.collision and (self.continuous_collision or self.event_driven):
+            r_x, r_y, r_angle, toi = swept_collision(self.wall_set, self.x, self.y, self.angle, self.vl, self.vr,
+                                                     self.l, self.radius, delta_time)
+        else:
+            r_x, r_y, r_angle = self.differential_drive(delta_time)
+            if self.collision:
+                r_x, r_y = self.check_collision(r_x, r_y, active)
+
+        self.x = np.where(active, r_x, self.x)
+        self.y = np.where(active, r_y, self.y)
+        self.angle = np.where(active, r_angle, self.angle)
+
+        self.collect_sensor_data(active)
+        if self.event_driven:
+            self.contact_events += int(np.sum(active & (toi < delta_time)))
+            self.clean_path_area(prev_x, prev_y, prev_angle, toi, active)
+        elif self.swept_coverage:
+            self.clean_capsule_area(prev_x, prev_y, active)
+        else:
+            self.clean_circle_area(active)
+
+    def differential_drive(self, delta_time):
+        """
+            Batched Robot.differential_drive
+        """
+        diff = self.vr - self.vl
+        R = self.l / 2 * (self.vl + self.vr) / np.where(diff != 0, diff, 0.0001)  # avoid division by zero
+        icc_x = self.x - R * np.sin(self.angle)
+        icc_y = self.y + R * np.cos(self.angle)
+        w = (self.vr - self.vl) / self.l
+        angle_change = w * delta_time
+
+        # Drive straight when both wheels have the same speed, otherwise rotate around the icc
+        straight = (self.vr == self.vl) & (self.vr != 0)
+        r_x = np.where(straight, self.x + self.vr * np.cos(self.angle) * delta_time,
+                       np.cos(angle_change) * (self.x - icc_x) - np.sin(angle_change) * (self.y - icc_y) + icc_x)
+        r_y = np.where(straight, self.y + self.vr * np.sin(self.angle) * delta_time,
+                       np.sin(angle_change) * (self.x - icc_x) + np.cos(angle_change) * (self.y - icc_y) + icc_y)
+        r_angle = (self.angle + angle_change) % (2 * math.pi)
+
+        return r_x, r_y, r_angle
+
+    def check_collision(self, r_x, r_y, active):
+        """
+            Batched World.slide_collision, returns the resolved positions
+        """
+        requested = np.stack((r_x, r_y), axis=1)
+        with np.errstate(invalid="ignore"):
+            colliding_walls = self.wall_set.distances(requested) < self.radius
+        colliding = np.flatnonzero(active & np.any(colliding_walls, axis=1))
+        if len(colliding) == 0:
+            return r_x, r_y
+
+        # The slide location of every colliding robot for every wall, tested against every wall at once
+        slide_locs = self.wall_set.slide_locations(requested[colliding], self.radius)
+        n_walls = slide_locs.shape[1]
+        with np.errstate(invalid="ignore"):
+            blocked = self.wall_set.distances(slide_locs.reshape(-1, 2)) < self.radius
+        blocked = np.any(blocked, axis=1).reshape(len(colliding), n_walls)
+        free = colliding_walls[colliding] & ~blocked & np.all(np.isfinite(slide_locs), axis=-1)
+
+        # Take the first slide location that is free from all walls, otherwise stay at the old location
+        first_free = np.argmax(free, axis=1)
+        any_free = np.any(free, axis=1)
+        chosen = slide_locs[np.arange(len(colliding)), first_free]
+        r_x = r_x.copy()
+        r_y = r_y.copy()
+        r_x[colliding] = np.where(any_free, chosen[:, 0], self.x[colliding])
+        r_y[colliding] = np.where(any_free, chosen[:, 1], self.y[colliding])
+        return r_x, r_y
+
+    def collect_sensor_data(self, active):
+        """
+            Batched Robot.collect_sensor_data, casts the rays of all robots at once
+        """
+        robots = np.flatnonzero(active)
+        if len(robots) == 0:
+            return
+
+        raycast_length = self.radius + self.max_sensor_length
+        delta_angle = (math.pi * 2) / self.n_sensors
+        sensor_angles = self.angle[robots, None] + delta_angle * np.arange(self.n_sensors)
+
+        starts = np.repeat(np.stack((self.x[robots], self.y[robots]), axis=1), self.n_sensors, axis=0)
+        if self.sensor_table is not None:
+            dists = np.minimum(self.sensor_table.lookup(starts, sensor_angles.reshape(-1)), raycast_length)
+            self.sensor_data[robots] = dists.reshape(len(robots), self.n_sensors) - self.radius
+            return
+
+        directions = np.stack((np.cos(sensor_angles), np.sin(sensor_angles)), axis=-1).reshape(-1, 2)
+        ray_cast = self.wall_set.raycast if self.distance_field is None else self.distance_field.raycast
+        _, dists, _ = ray_cast(starts, starts + directions * raycast_length, raycast_length)
+        self.sensor_data[robots] = dists.reshape(len(robots), self.n_sensors) - self.radius
+
+    def clean_circle_area(self, active):
+        """
+            Batched DustGrid.clean_circle_area, cleans the bounding box of every robot
+        """
+        robots = np.flatnonzero(active)
+        if len(robots) == 0:
+            return
+
+        x_start = ((self.x[robots] - self.radius) // self.cell_size).astype(np.int64)
+        x_end = ((self.x[robots] + self.radius) // self.cell_size + 1).astype(np.int64)
+        y_start = ((self.y[robots] - self.radius) // self.cell_size).astype(np.int64)
+        y_end = ((self.y[robots] + self.radius) // self.cell_size + 1).astype(np.int64)
+
+        # Every bounding box fits in a span x span window, mask the part of the window outside the box or grid
+        n_rows, n_cols = self.cells.shape[1:]
+        span = int(2 * self.radius // self.cell_size) + 2
+        offsets = np.arange(span)
+        cols = x_start[:, None] + offsets
+        rows = y_start[:, None] + offsets
+        col_mask = (cols < x_end[:, None]) & (cols >= 0) & (cols < n_cols)
+        row_mask = (rows < y_end[:, None]) & (rows >= 0) & (rows < n_rows)
+        mask = row_mask[:, :, None] & col_mask[:, None, :]
+
+        shape = mask.shape
+        robot_index = np.broadcast_to(robots[:, None, None], shape)[mask]
+        row_index = np.broadcast_to(rows[:, :, None], shape)[mask]
+        col_index = np.broadcast_to(cols[:, None, :], shape)[mask]
+
+        # Clean area
+        self.cleaned_cells += np.bincount(robot_index, weights=self.cells[robot_index, row_index, col_index],
+                                          minlength=self.n_robots).astype(np.int64)
+        self.cells[robot_index, row_index, col_index] = False
+
+    def clean_capsule_area(self, prev_x, prev_y, active):
+        """
+            Batched DustGrid.clean_capsule_area, cleans the cells whose center is within radius of the path from the
+            previous to the current position of every robot
+        """
+        robots = np.flatnonzero(active)
+        if len(robots) == 0:
+            return
+
+        start_x, start_y = prev_x[robots], prev_y[robots]
+        end_x, end_y = self.x[robots], self.y[robots]
+        x_start = ((np.minimum(start_x, end_x) - self.radius) // self.cell_size).astype(np.int64)
+        x_end = ((np.maximum(start_x, end_x) + self.radius) // self.cell_size + 1).astype(np.int64)
+        y_start = ((np.minimum(start_y, end_y) - self.radius) // self.cell_size).astype(np.int64)
+        y_end = ((np.maximum(start_y, end_y) + self.radius) // self.cell_size + 1).astype(np.int64)
+
+        # Every bounding box fits in a window of the largest box, mask the part of the window outside the box or grid
+        n_rows, n_cols = self.cells.shape[1:]
+        cols = x_start[:, None] + np.arange(np.max(x_end - x_start))
+        rows = y_start[:, None] + np.arange(np.max(y_end - y_start))
+        col_mask = (cols < x_end[:, None]) & (cols >= 0) & (cols < n_cols)
+        row_mask = (rows < y_end[:, None]) & (rows >= 0) & (rows < n_rows)
+
+        # Distance from the cell centers to the path of the circle center
+        center_x = (cols[:, None, :] + 0.5) * self.cell_size
+        center_y = (rows[:, :, None] + 0.5) * self.cell_size
+        dx = (end_x - start_x)[:, None, None]
+        dy = (end_y - start_y)[:, None, None]
+        length_sq = dx * dx + dy * dy
+        t = ((center_x - start_x[:, None, None]) * dx + (center_y - start_y[:, None, None]) * dy) / \
+            np.where(length_sq > 0, length_sq, 1.0)
+        t = np.clip(t, 0, 1)
+        dist_x = center_x - (start_x[:, None, None] + t * dx)
+        dist_y = center_y - (start_y[:, None, None] + t * dy)
+        mask = row_mask[:, :, None] & col_mask[:, None, :] & (dist_x * dist_x + dist_y * dist_y <= self.radius ** 2)
+
+        shape = mask.shape
+        robot_index = np.broadcast_to(robots[:, None, None], shape)[mask]
+        row_index = np.broadcast_to(rows[:, :, None], shape)[mask]
+        col_index = np.broadcast_to(cols[:, None, :], shape)[mask]
+
+        # Clean area
+        self.cleaned_cells += np.bincount(robot_index, weights=self.cells[robot_index, row_index, col_index],
+                                          minlength=self.n_robots).astype(np.int64)
+        self.cells[robot_index, row_index, col_index] = False
+
+    def clean_path_area(self, prev_x, prev_y, prev_angle, duration, active):
+        """
+            Batched DustGrid.clean_path_area, cleans the cells whose center is within radius of the arc every robot
+            drove from its previous pose for duration and its slide to the current position
+        """
+        robots = np.flatnonzero(active)
+        if len(robots) == 0:
+            return
+
+        x, y, angle = prev_x[robots], prev_y[robots], prev_angle[robots]
+        vl, vr, duration = self.vl[robots], self.vr[robots], duration[robots]
+        end_x, end_y = self.x[robots], self.y[robots]
+        # The arc is never further from its start than the distance the robot drives
+        reach = np.abs(vl + vr) / 2 * duration
+        x_start = ((np.minimum(x - reach, end_x) - self.radius) // self.cell_size).astype(np.int64)
+        x_end = ((np.maximum(x + reach, end_x) + self.radius) // self.cell_size + 1).astype(np.int64)
+        y_start = ((np.minimum(y - reach, end_y) - self.radius) // self.cell_size).astype(np.int64)
+        y_end = ((np.maximum(y + reach, end_y) + self.radius) // self.cell_size + 1).astype(np.int64)
+
+        # Every bounding box fits in a window of the largest box, mask the part of the window outside the box or grid
+        n_rows, n_cols = self.cells.shape[1:]
+        cols = x_start[:, None] + np.arange(np.max(x_end - x_start))
+        rows = y_start[:, None] + np.arange(np.max(y_end - y_start))
+        col_mask = (cols < x_end[:, None]) & (cols >= 0) & (cols < n_cols)
+        row_mask = (rows < y_end[:, None]) & (rows >= 0) & (rows < n_rows)
+
+        center_x = (cols[:, None, :] + 0.5) * self.cell_size
+        center_y = (rows[:, :, None] + 0.5) * self.cell_size
+        args = [value[:, None, None] for value in (x, y, angle, vl, vr)]
+        dists = path_distances(center_x, center_y, *args, self.l, duration[:, None, None], end_x[:, None, None],
+                               end_y[:, None, None])
+        mask = row_mask[:, :, None] & col_mask[:, None, :] & (dists <= self.radius)
+
+        shape = mask.shape
+        robot_index = np.broadcast_to(robots[:, None, None], shape)[mask]
+        row_index = np.broadcast_to(rows[:, :, None], shape)[mask]
+        col_index = np.broadcast_to(cols[:, None, :], shape)[mask]
+
+        # Clean area
+        self.cleaned_cells += np.bincount(robot_index, weights=self.cells[robot_index, row_index, col_index],
+                                          minlength=self.n_robots).astype(np.int64)
+        self.cells[robot_index, row_index, col_index] = False
@@ -0,0 +1,93 @@
+import math
+import numpy as np
+
+
+def point_segment_distances(points, starts, ends):
+    """
+    Distance from every point to every segment
+    @param points: (n, 2) points
+    @param starts: (m, 2) segment starts
+    @param ends: (m, 2) segment ends
+    @return: (n, m) distances
+    """
+    seg = ends - starts
+    seg_len_sq = np.sum(seg * seg, axis=-1)
+    pt = points[:, None, :] - starts[None, :, :]
+    proj = np.sum(pt * seg[None, :, :], axis=-1) / np.where(seg_len_sq > 0, seg_len_sq, 1.0)
+    proj = np.clip(proj, 0, 1)
+    closest = starts[None, :, :] + proj[..., None] * seg[None, :, :]
+    delta = points[:, None, :] - closest
+    return np.sqrt(np.sum(delta * delta, axis=-1))
+
+
+class WallGrid:
+    """
+        Uniform grid over the wall segments, every cell knows which walls pass through it.
+        Queries only look at the cells that are touched by the query shape and return the wall indices sorted,
+        so looping over the result visits the walls in the same order as a linear scan would.
+    """
+    def __init__(self, starts, ends, cell_size=50):
+        self.cell_size = cell_size
+        self.n_walls = len(starts)
+
+        starts = np.asarray(starts, dtype=np.float64).reshape(-1, 2)
+        ends = np.asarray(ends, dtype=np.float64).reshape(-1, 2)
+        if self.n_walls > 0:
+            self.origin = np.minimum(starts.min(axis=0), ends.min(axis=0))
+            extent = np.maximum(starts.max(axis=0), ends.max(axis=0)) - self.origin
+        else:
+            self.origin = np.zeros(2)
+            extent = np.zeros(2)
+        self.n_cols = int(extent[0] // cell_size) + 1
+        self.n_rows = int(extent[1] // cell_size) + 1
+
+        # Register every wall in all the cells it touches
+        cells = [[] for _ in range(self.n_cols * self.n_rows)]
+        for i in range(self.n_walls):
+            for cell in self.__segment_cells__(starts[i], ends[i]):
+                cells[cell].append(i)
+        self.cells = [np.array(walls, dtype=np.int64) for walls in cells]
+
+    def query_segment(self, start, end, margin=0.0):
+        """
+            Returns the indices of the walls that can intersect with the segment from start to end
+        """
+        return self.__collect__(self.__segment_cells__(start, end, margin))
+
+    def query_circle(self, center, radius):
+        """
+            Returns the indices of the walls that can intersect with the circle
+        """
+        return self.__collect__(self.__segment_cells__(center, center, radius))
+
+    def __collect__(self, cells):
+        walls = [self.cells[cell] for cell in cells if len(self.cells[cell]) > 0]
+        if len(walls) == 0:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate(walls))
+
+    def __segment_cells__(self, start, end, margin=0.0):
+        """
+            Conservatively finds all the (flattened) cells that are within margin of the segment
+        """
+        start = np.array([start[0], start[1]], dtype=np.float64) - self.origin
+        end = np.array([end[0], end[1]], dtype=np.float64) - self.origin
+
+        # Only look at the cells in the bounding box of the segment
+        low = np.floor((np.minimum(start, end) - margin) / self.cell_size).astype(np.int64)
+        high = np.floor((np.maximum(start, end) + margin) / self.cell_size).astype(np.int64)
+        low = np.maximum(low, 0)
+        high = np.minimum(high, (self.n_cols - 1, self.n_rows - 1))
+        if np.any(high < low):
+            return np.empty(0, dtype=np.int64)
+
+        cols, rows = np.meshgrid(np.arange(low[0], high[0] + 1), np.arange(low[1], high[1] + 1))
+        cols = cols.reshape(-1)
+        rows = rows.reshape(-1)
+
+        # A cell is touched if the segment comes closer to its center than half the diagonal
+        centers = (np.stack((cols, rows), axis=-1) + 0.5) * self.cell_size
+        dists = point_segment_distances(centers, start[None, :], end[None, :])[:, 0]
+        reach = self.cell_size * math.sqrt(2) / 2 + margin + 1e-6 * self.cell_size
+        touched = dists <= reach
+        return rows[touched] * self.n_cols + cols[touched]
@@ -1,18 +1,38 @@
-from simulation.line_wall import LineWall
+from simulation.line_wall import WallSet
 from simulation.dustgrid import DustGrid
+from simulation.wall_grid import WallGrid
 from pygame.math import Vector2
 import numpy as np
 import math
 
 
 class World:
-    def __init__(self, walls, width, height, scenario, beacons=None):
-        self.walls = walls
+    def __init__(self, walls, width, height, scenario, beacons=None, grid_cell_size=50, wall_grid=None,
+                 swept_coverage=False, distance_field=None, sensor_table=None, event_driven=False):
+        # The geometry lives in the wall set, the LineWalls are only views of it for drawing
+        self.wall_set = walls if isinstance(walls, WallSet) else WallSet.from_line_walls(walls)
+        self.walls = self.wall_set.line_walls()
+        # The walls are static, so the spatial index only has to be built once (or can be shared between worlds)
+        self.wall_grid = wall_grid if wall_grid is not None else \
+            WallGrid(self.wall_set.starts, self.wall_set.ends, grid_cell_size)
+        # Optional raster backend for the raycasts and circle collisions, see DistanceField
+        self.distance_field = distance_field
+        # Optional precomputed sensor distances, see SensorTable. Used for the robot sensors instead of raycasts
+        self.sensor_table = sensor_table
         self.scenario = scenario
         if scenario == "evolutionary":
             self.dustgrid = DustGrid(width, height, 5)
+            # Clean the whole path of the robot instead of only the square around its end position
+            self.swept_coverage = swept_coverage
+            # Clean exactly along the arc the robot drove until its first wall contact and its slide after that,
+            # the robot needs continuous collision for this. The slide is a straight line for the rest of the step,
+            # not the rest of the arc
+            self.event_driven = event_driven
         if scenario == "localization":
             self.beacons = beacons
+            # Keep the beacon positions in an array so visibility can be checked for all beacons at once
+            self.beacon_locations = np.array([(beacon.location[0], beacon.location[1]) for beacon in beacons or []],
+                                             dtype=np.float64).reshape(-1, 2)
 
     def set_robot(self, robot):
         self.robot = robot
@@ -20,107 +40,129 @@ class World:
         self.robot.world = self
 
     def update(self, delta_time):
+        prev_x = self.robot.x
+        prev_y = self.robot.y
+        prev_angle = self.robot.angle
         self.robot.update(delta_time)
         if self.scenario == "evolutionary":
-            self.dustgrid.clean_circle_area(self.robot.x, self.robot.y, self.robot.radius)
+            if self.event_driven:
+                self.dustgrid.clean_path_area(prev_x, prev_y, prev_angle, self.robot.vl, self.robot.vr, self.robot.l,
+                                              self.robot.time_of_impact, self.robot.x, self.robot.y, self.robot.radius)
+            elif self.swept_coverage:
+                self.dustgrid.clean_capsule_area(prev_x, prev_y, self.robot.x, self.robot.y, self.robot.radius)
+            else:
+                self.dustgrid.clean_circle_area(self.robot.x, self.robot.y, self.robot.radius)
 
     def get_beacons(self, x, y, r):
         # Return the beacons in range
-        beacons_in_range = []
-        for beacon in self.beacons:
-            b_x = beacon.location[0]
-            b_y = beacon.location[1]
-            # Check if in range
-            distance_from_robot = math.sqrt((b_x - x) ** 2 + (b_y - y) ** 2)
-            if distance_from_robot <= r:
-                # Beacon is in range, check if the sensor collides with a wall. We cannot see beacons through walls
-                hit = self.raycast_beacon((x, y), (b_x, b_y))
-                if not hit:
-                    # No walls in the way
-                    beacons_in_range.append((beacon, distance_from_robot))
-
-        return beacons_in_range
+        position = np.array([x, y], dtype=np.float64)
+        delta = self.beacon_locations - position
+        distances = np.sqrt(delta[:, 0] ** 2 + delta[:, 1] ** 2)
+        in_range = np.flatnonzero(distances <= r)
+        if len(in_range) == 0:
+            return []
+
+        # Check if the lines of sight collide with a wall, we cannot see beacons through walls.
+        # Only walls within range can block the lines of sight
+        candidates = self.wall_grid.query_circle(position, r)
+        visible = np.ones(len(in_range), dtype=bool)
+        if len(candidates) > 0:
+            beacon_locs = self.beacon_locations[in_range]
+            # Lines of sight along the first axis, walls along the second
+            t, _, valid = self.wall_set.intersect_segments(position, beacon_locs, candidates)
+            inters = position + t[..., None] * (beacon_locs - position)[:, None, :]
+
+            # Intersections at the beacon location +- some error do not block the line of sight
+            margin = 0.001
+            inter_delta = inters - beacon_locs[:, None, :]
+            at_beacon = np.sqrt(inter_delta[..., 0] ** 2 + inter_delta[..., 1] ** 2) < margin
+            visible = ~np.any(valid & ~at_beacon, axis=1)
+
+        return [(self.beacons[i], float(distances[i])) for i in in_range[visible]]
 
     def raycast(self, x, y, angle, max_length):
         # angle is in radians
-        # Calculate the start from x and y
-        start = Vector2(x, y)
-
-        # Calculate the direction from angle
-        direction = Vector2(math.cos(angle), math.sin(angle))
-        end = start + direction * max_length
-
-        closest_inter = None
-        closest_dist = max_length
-        closest_line = None
-        for wall in self.walls:
-            inter, dist, line = wall.check_line_intercept(start, end)
-
-            # Check if the intersection is the closest to our start
-            if (inter is not None) and (dist < closest_dist) and (line is not None):
-                closest_inter = inter
-                closest_dist = dist
-                closest_line = line
-
-        return closest_inter, closest_dist, closest_line
+        hits, distances, wall_ids = self.raycast_many(x, y, [angle], max_length)
+        if np.isnan(hits[0, 0]):
+            return None, max_length, None
+
+        # The sensor table does not know which wall was hit
+        wall = self.walls[wall_ids[0]] if wall_ids[0] >= 0 else None
+        return Vector2(*hits[0]), distances[0], None if wall is None else (wall.start, wall.end)
+
+    def raycast_many(self, x, y, angles, max_length, cache=None):
+        """
+            Casts a ray for every angle from (x, y) and intersects all of them with all walls at once
+            @param angles: ray angles in radians
+            @param cache: RaycastCache of the robot, the rays are only intersected with their candidate walls
+            @return: hit points (nan if nothing was hit), distances (max_length if nothing was hit)
+                     and the index of the hit wall (-1 if nothing was hit or if the sensor table was used)
+        """
+        angles = np.asarray(angles, dtype=np.float64).reshape(-1)
+        start = np.array([x, y], dtype=np.float64)
+        directions = np.stack((np.cos(angles), np.sin(angles)), axis=-1)
+        ends = start + directions * max_length
+        if (self.sensor_table is not None) and (max_length <= self.sensor_table.max_length):
+            return self.sensor_table.raycast(start, ends, max_length)
+        if self.distance_field is not None:
+            return self.distance_field.raycast(start, ends, max_length)
+        if cache is not None:
+            return cache.raycast(self.wall_set, x, y, angles, max_length)
+
+        # Only the walls within reach of the rays have to be checked
+        candidates = self.wall_grid.query_circle(start, max_length)
+        return self.wall_set.raycast(start, ends, max_length, candidates)
 
     def raycast_beacon(self, start, beacon_loc):
-        # angle is in radians
-        # Calculate the start from x and y
-        start = Vector2(start)
-        beacon_loc = Vector2(beacon_loc)
+        start = np.array([start[0], start[1]], dtype=np.float64)
+        beacon_loc = np.array([beacon_loc[0], beacon_loc[1]], dtype=np.float64)
 
-        for wall in self.walls:
-            inter, dist, line = wall.check_line_intercept(start, beacon_loc)
+        candidates = self.wall_grid.query_segment(start, beacon_loc)
+        if len(candidates) == 0:
+            return False
 
+        t, _, valid = self.wall_set.intersect_segments(start, beacon_loc, candidates)
+        inters = start + t[0, :, None] * (beacon_loc - start)
 
-            if inter is not None:
-                # Check if the intersect is at the beacon location +- some error
-                margin = 0.001
-                if math.sqrt((inter[0] - beacon_loc[0])**2 + (inter[1] - beacon_loc[1])**2) < margin:
-                    # Beacon is at the intersection
-                    continue
-                else:
-                    # Beacon not in line of sight
-                    return True
-
-        return False
+        # Intersections at the beacon location +- some error do not block the line of sight
+        margin = 0.001
+        delta = inters - beacon_loc
+        at_beacon = np.sqrt(delta[:, 0] ** 2 + delta[:, 1] ** 2) < margin
+        return bool(np.any(valid[0] & ~at_beacon))
 
     def circle_collision(self, circle_position, radius):
-        circle_position = Vector2(circle_position)
+        if self.distance_field is not None:
+            wall_ids, offsets = self.distance_field.circle_intercepts(circle_position, radius)
+            return [(self.walls[wall_id], Vector2(*offset)) for wall_id, offset in zip(wall_ids, offsets)]
 
-        collisions = []
-        # prev_intercept = False
-        for wall in self.walls:
-            offset = wall.check_circle_intercept(circle_position, radius)
-            if offset is not None:
-                collisions.append((wall, offset))
+        candidates = self.wall_grid.query_circle(circle_position, radius)
+        if len(candidates) == 0:
+            return []
 
-        return collisions
+        intercepts, offsets = self.wall_set.circle_intercepts(circle_position, radius, candidates)
+        return [(self.walls[wall_id], Vector2(*offset))
+                for wall_id, offset in zip(candidates[intercepts], offsets[intercepts])]
 
     def slide_collision(self, circle_position, r_circle_position, radius):
-        circle_position = Vector2(circle_position)
-        r_circle_position = Vector2(r_circle_position)
-
-        collisions = self.circle_collision(r_circle_position, radius)
-        if len(collisions) == 0:
+        candidates = self.wall_grid.query_circle(r_circle_position, radius)
+        if len(candidates) == 0:
+            return None
+        intercepts, _ = self.wall_set.circle_intercepts(r_circle_position, radius, candidates)
+        if not np.any(intercepts):
             return None
 
-        # Check if the slide locations do not cause interceptions, take the first slide location that did not cause
-        # an intercept
-        for wall, offset in collisions:
-            slide_loc = wall.calculate_sliding(r_circle_position, radius)
-
-            free_from_all = True
-            for wall in self.walls:
-                intercept = wall.check_circle_intercept(slide_loc, radius)
-                if intercept:
-                    # Not free from all walls
-                    free_from_all = False
+        # The slide locations are at most radius away from the requested location,
+        # so only the walls within reach of the slid circles can intercept them
+        slide_locs = self.wall_set.slide_locations(r_circle_position, radius, candidates[intercepts])[0]
+        nearby = self.wall_grid.query_circle(r_circle_position, 2 * radius + 1)
 
-            if free_from_all:
-                # This slide position is free from all walls
-                return slide_loc
+        # Check all the slide locations against all walls at once and take the first slide location that did not
+        # cause an intercept
+        with np.errstate(invalid="ignore"):
+            blocked = np.any(self.wall_set.distances(slide_locs, nearby) < radius, axis=1)
+        free = ~blocked & np.all(np.isfinite(slide_locs), axis=1)
+        if np.any(free):
+            return Vector2(*slide_locs[np.argmax(free)])
 
         # At this point all the slide positions are behind walls, return the old location
-        return circle_position
+        return Vector2(circle_position)
@@ -1,6 +1,9 @@
 from simulation.world import World
 from simulation.robot import Robot
-from simulation.line_wall import LineWall
+from simulation.line_wall import LineWall, WallSet
+from simulation.wall_grid import WallGrid
+from simulation.distance_field import DistanceField
+from simulation.sensor_table import SensorTable
 from simulation.beacon import Beacon
 import numpy as np
 import math
@@ -82,89 +85,301 @@ def create_localization_maze_walls_and_beacons(width, height, offset):
 
     return walls, beacons
 
+# The worlds that create_random_world chooses from
+RANDOM_WORLDS = ["rect_world", "double_rect_world", "trapezoid_world", "double_trapezoid_world", "star_world"]
+
+
+class EpisodeBank:
+    """
+        Fixed list of (world name, robot start location) episodes, all genomes are evaluated on the same episodes so
+        their fitness differences are not caused by luck with the episodes (common random numbers).
+        The episodes follow from the seed, so every process that knows the seed can rebuild the same bank.
+    """
+    def __init__(self, seed, episodes):
+        self.seed = seed
+        self.episodes = episodes
+
+    def __len__(self):
+        return len(self.episodes)
+
+    def __getitem__(self, index):
+        return self.episodes[index]
+
+
 class WorldGenerator:
-    def __init__(self, width, height, robot_radius, world_name, scenario, collision):
+    def __init__(self, width, height, robot_radius, world_name, scenario, collision, free_start=False,
+                 free_space_cell_size=5, exact_check=True, continuous_collision=False, swept_coverage=False,
+                 raster_resolution=None, max_sensor_length=100, sensor_table_resolution=None, sensor_table_angles=360,
+                 sensor_table_dir="sensor_tables", ray_cache_margin=None, sensor_period=0.0, event_driven=False):
+        """
+            @param free_start: draw the start locations of all worlds from the free space of the layout instead of
+                               the start area of the world
+            @param free_space_cell_size: cell size of the free space map
+            @param exact_check: check a start location drawn from the free space map against the walls, the map
+                                only guarantees that the center of its cell is free
+            @param continuous_collision: the robots sweep along their motion to find collisions, see Robot
+            @param swept_coverage: the robots clean their whole path instead of the square around their position
+            @param raster_resolution: node distance of the DistanceField that the worlds use for raycasts and circle
+                                      collisions, None uses the exact walls
+            @param max_sensor_length: sensor length of the robots
+            @param sensor_table_resolution: node distance of the SensorTable that the robots use for sensing instead
+                                            of raycasts, None casts the rays
+            @param sensor_table_angles: number of ray angles of the sensor table
+            @param sensor_table_dir: where the sensor tables are cached, a layout only has to be tabulated once
+            @param ray_cache_margin: margin of the RaycastCache of the robots, None tests the rays against all walls
+                                     in reach
+            @param sensor_period: sensor schedule of the robots, see Robot
+            @param event_driven: the robots drive analytically to the end of the step or their first wall contact
+                                 (continuous collision) and clean along their exact path, see World. After a
+                                 contact they slide in a straight line for the rest of the step
+        """
         self.width = width
         self.height = height
         self.robot_radius = robot_radius
         self.world_name = world_name
         self.scenario = scenario
         self.collision = collision
+        self.free_start = free_start
+        self.free_space_cell_size = free_space_cell_size
+        self.exact_check = exact_check
+        self.continuous_collision = continuous_collision
+        self.swept_coverage = swept_coverage
+        self.raster_resolution = raster_resolution
+        self.max_sensor_length = max_sensor_length
+        self.sensor_table_resolution = sensor_table_resolution
+        self.sensor_table_angles = sensor_table_angles
+        self.sensor_table_dir = sensor_table_dir
+        self.ray_cache_margin = ray_cache_margin
+        self.sensor_period = sensor_period
+        self.event_driven = event_driven
+
+        # The layouts only depend on the world size, so their geometry is built once and shared by all the worlds
+        self.layouts = {}
+        self.episode_bank = None
 
     def create_rect_world(self, random_robot=True):
-        walls = create_rect_walls(self.width / 2, self.height / 2, self.width, self.height)
+        return self.__create__("rect_world", random_robot)
 
-        world = World(walls, self.width, self.height, self.scenario)
+    def create_double_rect_world(self, random_robot=True):
+        return self.__create__("double_rect_world", random_robot)
 
-        min_x = self.robot_radius
-        max_x = self.width - self.robot_radius
-        min_y = self.robot_radius
-        max_y = self.height - self.robot_radius
-        margin = 20
-        x = random.uniform(min_x + margin, max_x - margin)
-        y = random.uniform(min_y + margin, max_y - margin)
-        robot_start_loc = (x, y, np.random.uniform(0, 2 * np.pi))
+    def create_trapezoid_world(self, random_robot=True):
+        return self.__create__("trapezoid_world", random_robot)
+
+    def create_double_trapezoid_world(self, random_robot=True):
+        return self.__create__("double_trapezoid_world", random_robot)
+
+    def create_star_world(self, random_robot=True):
+        return self.__create__("star_world", random_robot)
+
+    def create_localization_maze(self, random_robot=False):
+        return self.__create__("localization_maze", random_robot)
 
+    def create_random_world(self, random_robot=True):
+        world_name = random.choice(RANDOM_WORLDS)
+        return self.__create__(world_name, random_robot)
+
+    def create_world(self, random_robot=True):
+        if self.world_name == "random":
+            return self.create_random_world(random_robot)
+        return self.__create__(self.world_name, random_robot)
+
+    def create_episode(self, world_name, robot_start_loc=None, random_robot=True):
+        """
+            Builds a world with the (shared) layout of world_name and places the robot at robot_start_loc,
+            a random robot without start location is placed somewhere in the free space of the layout
+        """
+        layout = self.__layout__(world_name)
+        world = World(layout["wall_set"], self.width, self.height, self.scenario, beacons=layout["beacons"],
+                      wall_grid=layout["wall_grid"], swept_coverage=self.swept_coverage,
+                      distance_field=layout["distance_field"], sensor_table=layout["sensor_table"],
+                      event_driven=self.event_driven)
+        if random_robot and (robot_start_loc is None):
+            robot_start_loc = self.free_start_location(world_name)
         robot = self.__add_robot__(world, random_robot=random_robot, robot_start_loc=robot_start_loc)
         return world, robot
 
-    def create_double_rect_world(self, random_robot=True):
-        outer_walls = create_rect_walls(self.width / 2, self.height / 2, self.width, self.height)
-        inner_walls = create_rect_walls(self.width / 2, self.height / 2, self.width / 2, self.height / 2)
-        walls = [*outer_walls, *inner_walls]
+    def free_start_location(self, world_name, rng=random):
+        """
+            Draws a random start location (x, y, angle) from the free space map of the layout, every free cell is
+            equally likely
+            @param rng: random.Random or the random module
+        """
+        layout = self.__layout__(world_name)
+        if "free_cells" not in layout:
+            layout["free_cells"] = self.__free_cells__(layout["wall_set"])
+        free_cells = layout["free_cells"]
+        if len(free_cells) == 0:
+            raise ValueError(f"There is no room for the robot in {world_name}")
+
+        half_cell = self.free_space_cell_size / 2
+        center = free_cells[rng.randrange(len(free_cells))]
+        x = center[0] + rng.uniform(-half_cell, half_cell)
+        y = center[1] + rng.uniform(-half_cell, half_cell)
+        if self.exact_check and np.min(layout["wall_set"].distances((x, y))) < self.robot_radius:
+            # Too close to a wall near the edge of the cell, the cell center itself is always free
+            x, y = center
+        return float(x), float(y), rng.uniform(0, 2 * np.pi)
+
+    def create_episode_bank(self, num_episodes, seed=None):
+        """
+            Samples a new bank of episodes, the generator keeps it as its current bank
+            @param seed: the bank is random if no seed is given
+        """
+        if seed is None:
+            seed = random.randrange(2 ** 32)
+        rng = random.Random(seed)
+
+        episodes = []
+        for _ in range(num_episodes):
+            world_name = rng.choice(RANDOM_WORLDS) if self.world_name == "random" else self.world_name
+            episodes.append((world_name, self.__start_location__(world_name, rng)))
+
+        self.episode_bank = EpisodeBank(seed, episodes)
+        return self.episode_bank
+
+    def refresh_episode_bank(self, seed=None):
+        return self.create_episode_bank(len(self.episode_bank), seed)
+
+    def create_bank_world(self, index, random_robot=True):
+        """
+            Builds the world and robot of episode index of the current bank
+        """
+        world_name, robot_start_loc = self.episode_bank[index]
+        return self.create_episode(world_name, robot_start_loc, random_robot)
+
+    def __create__(self, world_name, random_robot):
+        return self.create_episode(world_name, self.__start_location__(world_name, random), random_robot)
+
+    def __layout__(self, world_name):
+        if world_name not in self.layouts:
+            walls, beacons = self.__layout_walls__(world_name)
+            wall_set = WallSet.from_line_walls(walls)
+            self.layouts[world_name] = {
+                "wall_set": wall_set,
+                "wall_grid": WallGrid(wall_set.starts, wall_set.ends),
+                "distance_field": None if self.raster_resolution is None else
+                DistanceField(wall_set, self.width, self.height, self.raster_resolution, reach=self.robot_radius),
+                "sensor_table": None if self.sensor_table_resolution is None else
+                SensorTable(wall_set, self.width, self.height, self.robot_radius + self.max_sensor_length,
+                            self.sensor_table_resolution, self.sensor_table_angles, self.sensor_table_dir),
+                "beacons": beacons
+            }
+        return self.layouts[world_name]
+
+    def __free_cells__(self, wall_set):
+        """
+            Rasterizes the free space of a layout, returns the centers of the cells that are at least robot_radius
+            away from every wall
+        """
+        cell_size = self.free_space_cell_size
+        xs = np.arange(0, self.width, cell_size) + cell_size / 2
+        ys = np.arange(0, self.height, cell_size) + cell_size / 2
+        centers = np.stack(np.meshgrid(xs, ys), axis=-1).reshape(-1, 2)
+
+        free = np.ones(len(centers), dtype=bool)
+        # Rows at a time, the distance matrix of all cells and walls at once can get large
+        for start in range(0, len(centers), 4096):
+            dists = wall_set.distances(centers[start:start + 4096])
+            free[start:start + 4096] = np.min(dists, axis=1) >= self.robot_radius
+        return centers[free]
+
+    def __layout_walls__(self, world_name):
+        border = create_rect_walls(self.width / 2, self.height / 2, self.width, self.height)
+        if world_name == "rect_world":
+            return border, None
+        elif world_name == "double_rect_world":
+            inner_walls = create_rect_walls(self.width / 2, self.height / 2, self.width / 2, self.height / 2)
+            return [*border, *inner_walls], None
+        elif world_name == "trapezoid_world":
+            trapezoid = create_trapezoid_walls(self.width / 2, self.height / 2, self.height, self.width,
+                                               self.width / 2)
+            return [*border, *trapezoid], None
+        elif world_name == "double_trapezoid_world":
+            outer_walls = create_trapezoid_walls(self.width / 2, self.height / 2, self.height, self.width,
+                                                 self.width / 2)
+            inner_walls = create_trapezoid_walls(self.width / 2, self.height / 2, self.height / 2, self.width / 2,
+                                                 self.width / 4)
+            return [*border, *outer_walls, *inner_walls], None
+        elif world_name == "star_world":
+            star = create_star_walls(self.width / 2, self.height / 2, self.height / 4, self.height / 2)
+            return [*border, *star], None
+        elif world_name == "localization_maze":
+            border_buffer = 10
+            effective_width = self.width - border_buffer * 2
+            effective_height = self.height - border_buffer * 2
+            border = create_rect_walls(self.width / 2, self.height / 2, effective_width, effective_height)
+            internal_walls, internal_beacons = create_localization_maze_walls_and_beacons(
+                effective_width, effective_height, border_buffer)
+            return [*border, *internal_walls], [*internal_beacons]
+        else:
+            raise ValueError("Wrong world name")
 
-        world = World(walls, self.width, self.height, self.scenario)
+    def __start_location__(self, world_name, rng):
+        """
+            Samples a robot start location (x, y, angle) for the layout of world_name
+            @param rng: random.Random or the random module
+        """
+        if self.free_start and (world_name != "localization_maze"):
+            return self.free_start_location(world_name, rng)
+        elif world_name == "rect_world":
+            return self.__rect_start__(rng)
+        elif world_name == "double_rect_world":
+            return self.__double_rect_start__(rng)
+        elif world_name == "trapezoid_world":
+            return self.__trapezoid_start__(rng)
+        elif world_name == "double_trapezoid_world":
+            return self.__double_trapezoid_start__(rng)
+        elif world_name == "star_world":
+            return self.__star_start__(rng)
+        elif world_name == "localization_maze":
+            return self.__localization_maze_start__(rng)
+        else:
+            raise ValueError("Wrong world name")
 
+    def __rect_start__(self, rng):
+        min_x = self.robot_radius
+        max_x = self.width - self.robot_radius
+        min_y = self.robot_radius
+        max_y = self.height - self.robot_radius
+        margin = 20
+        x = rng.uniform(min_x + margin, max_x - margin)
+        y = rng.uniform(min_y + margin, max_y - margin)
+        return x, y, rng.uniform(0, 2 * np.pi)
+
+    def __double_rect_start__(self, rng):
         x_left = self.width / 2 - self.width * 3 / 8
         x_right = self.width / 2 + self.width * 3 / 8
         y_up = self.height / 2 + self.height * 3 / 8
         y_down = self.height / 2 - self.height * 3 / 8
 
+        # Somewhere on the corridor between the inner and outer rectangle
         robot_start_loc = []
         x_options = np.linspace(x_left, x_right, 100)
         for x in x_options:
-            robot_start_loc.append((x, y_up, np.random.uniform(0, 2 * np.pi)))
-            robot_start_loc.append((x, y_down, np.random.uniform(0, 2 * np.pi)))
+            robot_start_loc.append((x, y_up))
+            robot_start_loc.append((x, y_down))
 
         y_options = np.linspace(y_down, y_up, 100)
         for y in y_options:
-            robot_start_loc.append((x_left, y, np.random.uniform(0, 2 * np.pi)))
-            robot_start_loc.append((x_right, y, np.random.uniform(0, 2 * np.pi)))
-
-        robot_start_loc = random.choice(robot_start_loc)
-
-        robot = self.__add_robot__(world, random_robot=random_robot, robot_start_loc=robot_start_loc)
-        return world, robot
-
-    def create_trapezoid_world(self, random_robot=True):
-        border = create_rect_walls(self.width / 2, self.height / 2, self.width, self.height)
-        trapezoid = create_trapezoid_walls(self.width / 2, self.height / 2, self.height, self.width, self.width / 2)
-        walls = [*border, *trapezoid]
+            robot_start_loc.append((x_left, y))
+            robot_start_loc.append((x_right, y))
 
-        world = World(walls, self.width, self.height, self.scenario)
+        x, y = rng.choice(robot_start_loc)
+        return x, y, rng.uniform(0, 2 * np.pi)
 
+    def __trapezoid_start__(self, rng):
         min_x = self.robot_radius
         max_x = self.width - self.robot_radius
         min_y = self.robot_radius
         max_y = self.height - self.robot_radius
         margin_x = self.width / 3
         margin_y = 20
-        x = random.uniform(min_x + margin_x, max_x - margin_x)
-        y = random.uniform(min_y + margin_y, max_y - margin_y)
-        robot_start_loc = (x, y, np.random.uniform(0, 2 * np.pi))
-
-        robot = self.__add_robot__(world, random_robot=random_robot, robot_start_loc=robot_start_loc)
-        return world, robot
-
-    def create_double_trapezoid_world(self, random_robot=True):
-        border = create_rect_walls(self.width / 2, self.height / 2, self.width, self.height)
-        outer_walls = create_trapezoid_walls(self.width / 2, self.height / 2, self.height, self.width, self.width / 2)
-        inner_walls = create_trapezoid_walls(self.width / 2, self.height / 2, self.height / 2, self.width / 2,
-                                             self.width / 4)
-        walls = [*border, *outer_walls, *inner_walls]
-
-        world = World(walls, self.width, self.height, self.scenario)
+        x = rng.uniform(min_x + margin_x, max_x - margin_x)
+        y = rng.uniform(min_y + margin_y, max_y - margin_y)
+        return x, y, rng.uniform(0, 2 * np.pi)
 
+    def __double_trapezoid_start__(self, rng):
         x_left_down = self.width / 2 - self.width * 3 / 8
         x_right_down = self.width / 2 + self.width * 3 / 8
         x_left_up = self.width / 2 - self.width * 1 / 5
@@ -175,100 +390,37 @@ class WorldGenerator:
         robot_start_loc = []
         x_options = np.linspace(x_left_down, x_right_down, 100)
         for x in x_options:
-            robot_start_loc.append((x, y_up, np.random.uniform(0, 2 * np.pi)))
+            robot_start_loc.append((x, y_up))
 
         x_options = np.linspace(x_left_up, x_right_up, 100)
         for x in x_options:
-            robot_start_loc.append((x, y_down, np.random.uniform(0, 2 * np.pi)))
-
-        robot_start_loc = random.choice(robot_start_loc)
-
-        robot = self.__add_robot__(world, random_robot=random_robot, robot_start_loc=robot_start_loc)
-        return world, robot
-
-    def create_star_world(self, random_robot=True):
-        border = create_rect_walls(self.width / 2, self.height / 2, self.width, self.height)
-        star = create_star_walls(self.width / 2, self.height / 2, self.height / 4, self.height / 2)
-        walls = [*border, *star]
+            robot_start_loc.append((x, y_down))
 
-        world = World(walls, self.width, self.height, self.scenario)
+        x, y = rng.choice(robot_start_loc)
+        return x, y, rng.uniform(0, 2 * np.pi)
 
+    def __star_start__(self, rng):
         radius = min(self.width / 6, self.height / 6)
-        radius = random.random() * radius
-        angle = random.random() * 2 * math.pi
+        radius = rng.random() * radius
+        angle = rng.random() * 2 * math.pi
 
-        robot_start_loc = (
-            int(self.width / 2 + radius * math.cos(angle)), int(self.height / 2 + radius * math.sin(angle)),
-            np.random.uniform(0, 2 * np.pi))
+        return (int(self.width / 2 + radius * math.cos(angle)), int(self.height / 2 + radius * math.sin(angle)),
+                rng.uniform(0, 2 * np.pi))
 
-        robot = self.__add_robot__(world, random_robot=random_robot, robot_start_loc=robot_start_loc)
-        return world, robot
-
-    def create_localization_maze(self, random_robot=False):
+    def __localization_maze_start__(self, rng):
         border_buffer = 10
-        effective_width = self.width - border_buffer*2
-        effective_height = self.height - border_buffer*2
-        border = create_rect_walls(self.width / 2, self.height / 2, effective_width, effective_height)
-        internal_walls, internal_beacons = create_localization_maze_walls_and_beacons(effective_width, effective_height, border_buffer)
-
-        walls = [*border, *internal_walls]
-
-        beacons = [*internal_beacons]
-
-        world = World(walls, self.width, self.height, self.scenario, beacons=beacons)
-        robot_start_loc = ((effective_width/6) + border_buffer, (effective_height/10) + border_buffer, 0)
-        robot = self.__add_robot__(world, random_robot=random_robot, robot_start_loc=robot_start_loc)
-        return world, robot
-
-    def create_random_world(self, random_robot=True):
-        world_func = random.choice([
-            self.create_rect_world,
-            self.create_double_rect_world,
-            self.create_trapezoid_world,
-            self.create_double_trapezoid_world,
-            self.create_star_world
-        ])
-
-        return world_func(random_robot=random_robot)
-
-    def create_world(self, random_robot=True):
-        if self.world_name == "rect_world":
-            return self.create_rect_world(random_robot)
-        elif self.world_name == "double_rect_world":
-            return self.create_double_rect_world(random_robot)
-        elif self.world_name == "trapezoid_world":
-            return self.create_trapezoid_world(random_robot)
-        elif self.world_name == "double_trapezoid_world":
-            return self.create_double_trapezoid_world(random_robot)
-        elif self.world_name == "star_world":
-            return self.create_star_world(random_robot)
-        elif self.world_name == "random":
-            return self.create_random_world(random_robot)
-        elif self.world_name == "localization_maze":
-            return self.create_localization_maze(random_robot)
-        else:
-            raise ValueError("Wrong world name")
+        effective_width = self.width - border_buffer * 2
+        effective_height = self.height - border_buffer * 2
+        return (effective_width / 6) + border_buffer, (effective_height / 10) + border_buffer, 0
 
     def __add_robot__(self, world, random_robot=True, robot_start_loc=None):
-        if random_robot and (robot_start_loc is None):
-            min_x = self.robot_radius
-            max_x = self.width - self.robot_radius
-            min_y = self.robot_radius
-            max_y = self.height - self.robot_radius
-            margin = 20
-            
-            while True:
-                rand_x = random.uniform(min_x + margin, max_x - margin)
-                rand_y = random.uniform(min_y + margin, max_y - margin)
-    
-                collisions = world.circle_collision((rand_x, rand_y), self.robot_radius)
-                if len(collisions) == 0:
-                    break
-        elif robot_start_loc is None:
+        if robot_start_loc is None:
             robot_start_loc = (self.width / 2, self.height / 2, 0)
 
-        # Place robot randomly until no collisions occur
-        robot = Robot(*robot_start_loc, scenario=self.scenario, radius=self.robot_radius,collision=self.collision)
+        robot = Robot(*robot_start_loc, scenario=self.scenario, radius=self.robot_radius, collision=self.collision,
+                      max_sensor_length=self.max_sensor_length,
+                      continuous_collision=self.continuous_collision or self.event_driven,
+                      ray_cache_margin=self.ray_cache_margin, sensor_period=self.sensor_period)
         world.set_robot(robot)
-        
+
         return robot
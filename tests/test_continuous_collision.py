@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from simulation.line_wall import WallSet
+from simulation.continuous_collision import drive_poses, swept_collision, time_of_impact
+
+
+def _drive(wall_set, x, y, angle, vl, vr, delta_time=0.27):
+    return swept_collision(wall_set, np.array([x]), np.array([y]), np.array([angle]), np.array([vl]), np.array([vr]),
+                           40, 20, delta_time)
+
+
+@pytest.mark.parametrize("gap", [0.005, 0.05, 0.2])
+def test_parallel_wall_does_not_stall(gap):
+    wall_set = WallSet([(0, 0)], [(1000, 0)])
+    x, y, _, toi = _drive(wall_set, 100.0, 20 + gap, 0.0, 100.0, 100.0)
+    assert toi[0] == pytest.approx(0.27)
+    assert x[0] == pytest.approx(127.0)
+    assert y[0] == pytest.approx(20 + gap)
+
+
+def test_head_on_contact():
+    wall_set = WallSet([(200, -100)], [(200, 100)])
+    x, _, _, toi = _drive(wall_set, 100.0, 0.0, 0.0, 500.0, 500.0)
+    # The robot stops within tolerance of the wall
+    assert toi[0] == pytest.approx((200 - 20 - 0.01 - 100) / 500)
+    assert x[0] == pytest.approx(200 - 20 - 0.01)
+
+
+def test_touching_robot_turning_into_wall_is_blocked():
+    wall_set = WallSet([(0, 0)], [(1000, 0)])
+    # Turning right drives the robot into the wall below it
+    toi = time_of_impact(wall_set, np.array([100.0]), np.array([20.005]), np.array([0.0]), np.array([100.0]),
+                         np.array([80.0]), 40, 20, 0.27)
+    assert toi[0] == 0.0
+
+
+def test_time_of_impact_matches_sampled_paths():
+    rng = np.random.default_rng(0)
+    wall_set = WallSet(rng.uniform(0, 400, (20, 2)), rng.uniform(0, 400, (20, 2)))
+    n = 300
+    x, y = rng.uniform(0, 400, n), rng.uniform(0, 400, n)
+    angle = rng.uniform(0, 2 * np.pi, n)
+    vl, vr = rng.uniform(-150, 150, n), rng.uniform(-150, 150, n)
+    vr[:50] = vl[:50]
+    free = np.min(wall_set.distances(np.stack((x, y), axis=1)), axis=1) > 21
+    x, y, angle, vl, vr = x[free], y[free], angle[free], vl[free], vr[free]
+
+    toi = time_of_impact(wall_set, x, y, angle, vl, vr, 40, 20, 0.27)
+    times = np.linspace(0, 0.27, 1001)
+    for i in range(len(x)):
+        p_x, p_y, _ = drive_poses(*(np.full(len(times), v) for v in (x[i], y[i], angle[i], vl[i], vr[i])), 40, times)
+        clearance = np.min(wall_set.distances(np.stack((p_x, p_y), axis=1)), axis=1) - 20
+        contacts = np.flatnonzero(clearance < 0.01)
+        if len(contacts) == 0:
+            assert toi[i] == 0.27
+        else:
+            assert times[contacts[0]] - times[1] <= toi[i] <= times[contacts[0]]
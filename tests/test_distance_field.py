@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+
+from simulation.line_wall import WallSet
+from simulation.distance_field import DistanceField
+
+
+def test_circle_intercepts_in_corner():
+    wall_set = WallSet([(0, 0), (0, 0)], [(100, 0), (0, 100)])
+    field = DistanceField(wall_set, 100, 100, resolution=2.0, reach=20)
+    wall_ids, offsets = field.circle_intercepts((18, 10), 20)
+    assert sorted(wall_ids) == [0, 1]
+
+    intercepts, exact_offsets = wall_set.circle_intercepts((18, 10), 20)
+    np.testing.assert_allclose(offsets[np.argsort(wall_ids)], exact_offsets[intercepts])
+
+
+def test_circle_intercepts_match_wall_set():
+    rng = np.random.default_rng(0)
+    wall_set = WallSet(rng.uniform(0, 200, (15, 2)), rng.uniform(0, 200, (15, 2)))
+    field = DistanceField(wall_set, 200, 200, resolution=4.0, reach=20)
+    for center in rng.uniform(0, 200, (300, 2)):
+        for radius in (10, 20):
+            wall_ids, _ = field.circle_intercepts(center, radius)
+            intercepts, _ = wall_set.circle_intercepts(center, radius)
+            assert sorted(wall_ids) == list(np.flatnonzero(intercepts))
+
+
+def test_circle_intercepts_beyond_reach():
+    wall_set = WallSet([(0, 0)], [(100, 0)])
+    with pytest.raises(ValueError):
+        DistanceField(wall_set, 100, 100, reach=20).circle_intercepts((50, 50), 25)
+    with pytest.raises(ValueError):
+        DistanceField(wall_set, 100, 100).circle_intercepts((50, 50), 10)
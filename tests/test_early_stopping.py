@@ -0,0 +1,37 @@
+import numpy as np
+
+from genetic.early_stopping import EarlyStopping, TERMINATIONS
+
+
+def _run(stopping, positions, cleaned):
+    """
+        Checks the steps until an episode stops
+        @return: the number of steps taken
+    """
+    for step, ((x, y), cells) in enumerate(zip(positions, cleaned), start=1):
+        stopping.check(np.array([x]), np.array([y]), np.array([cells]), np.zeros(1), np.ones(1))
+        if not stopping.active[0]:
+            return step
+    return len(positions)
+
+
+def test_no_displacement_needs_a_full_window():
+    stopping = EarlyStopping(1, steps=20, window=3, min_displacement=1.0)
+    # The robot never moves, the first full window of 3 steps ends after step 4
+    assert _run(stopping, [(0.0, 0.0)] * 10, [0] * 10) == 4
+    assert TERMINATIONS[stopping.codes[0]] == "no_displacement"
+    assert stopping.remaining_penalties[0] == 16
+
+
+def test_no_new_cells_needs_a_full_window():
+    stopping = EarlyStopping(1, steps=20, window=3, stop_on_no_new_cells=True)
+    cleaned = [0, 0, 0, 0, 0]
+    assert _run(stopping, [(float(i), 0.0) for i in range(5)], cleaned) == 4
+    assert TERMINATIONS[stopping.codes[0]] == "no_new_cells"
+
+
+def test_slow_robot_over_the_window():
+    stopping = EarlyStopping(1, steps=20, window=3, min_displacement=1.0)
+    # 0.4 per step is 1.2 over the window
+    assert _run(stopping, [(0.4 * i, 0.0) for i in range(1, 20)], range(1, 20)) == 19
+    assert stopping.active[0]
@@ -0,0 +1,35 @@
+import os
+
+import numpy as np
+import pytest
+
+from genetic.evaluation_pool import EvaluationPool
+
+
+def _create_evaluator(scale):
+    return lambda genomes: np.sum(genomes, axis=1) * scale
+
+
+def _count_shared_mappings():
+    with open("/proc/self/maps") as f:
+        return len({line.split()[-1] for line in f if "/psm_" in line})
+
+
+def _create_mapping_counter():
+    # Every genome gets the number of shared memory blocks the worker has mapped
+    return lambda genomes: np.full(len(genomes), _count_shared_mappings())
+
+
+def test_growing_batches():
+    with EvaluationPool(factory=_create_evaluator, factory_args={"scale": 2.0}, processes=2) as pool:
+        for size in (3, 10, 50, 7):
+            genomes = np.random.default_rng(size).normal(size=(size, 4))
+            np.testing.assert_allclose(pool.evaluate_batch(genomes), np.sum(genomes, axis=1) * 2.0)
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/maps"), reason="needs /proc to list the mappings")
+def test_worker_unmaps_replaced_blocks():
+    with EvaluationPool(factory=_create_mapping_counter, factory_args={}, processes=1) as pool:
+        # Every batch is larger than the block of the previous one, so the pool allocates a new block each time
+        for size in (1, 4, 16, 64):
+            assert np.all(pool.evaluate_batch(np.zeros((size, 8))) == 1)
@@ -0,0 +1,18 @@
+import numpy as np
+
+from genetic.fitness_cache import FitnessCache
+
+
+def test_lookup_and_store():
+    cache = FitnessCache(eval_func=lambda genome: float(np.sum(genome)), config="config")
+    genome = np.array([1.0, 2.0])
+    assert cache.lookup(genome) is None
+
+    cache.store(genome, 7.0)
+    assert cache.lookup(genome) == 7.0
+    # Stored fitness values are used by evaluate as well
+    assert cache.evaluate(genome) == 7.0
+    assert cache.stats()["hits"] == 2 and cache.stats()["misses"] == 1
+
+    cache.set_config("other config")
+    assert cache.lookup(genome) is None
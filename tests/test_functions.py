@@ -0,0 +1,20 @@
+import numpy as np
+import pytest
+
+from genetic.functions import average_ranks, spearman_correlation
+
+
+def test_average_ranks_of_ties():
+    np.testing.assert_array_equal(average_ranks([3.0, 1.0, 3.0, 2.0]), [2.5, 0.0, 2.5, 1.0])
+
+
+def test_spearman_correlation():
+    assert spearman_correlation([1, 2, 3, 4], [10, 20, 30, 40]) == pytest.approx(1.0)
+    assert spearman_correlation([1, 2, 3, 4], [4, 3, 2, 1]) == pytest.approx(-1.0)
+    # Pearson correlation of the average ranks [0, 1.5, 1.5, 3] and [0, 1, 2, 3]
+    assert spearman_correlation([1, 2, 2, 3], [1, 2, 3, 4]) == pytest.approx(0.9486833)
+
+
+def test_spearman_correlation_of_constant_values():
+    assert spearman_correlation([5, 5, 5], [1, 2, 3]) == 0.0
+    assert spearman_correlation([1, 2, 3], [0, 0, 0]) == 0.0
@@ -0,0 +1,31 @@
+import numpy as np
+
+from simulation.line_wall import WallSet
+from simulation.raycast_cache import RaycastCache
+
+
+def test_cached_raycasts_match_exact_raycasts():
+    rng = np.random.default_rng(0)
+    wall_set = WallSet(rng.uniform(0, 400, (40, 2)), rng.uniform(0, 400, (40, 2)))
+    cache = RaycastCache(margin=30.0)
+    offsets = np.linspace(0, 2 * np.pi, 12, endpoint=False)
+
+    x, y, angle = 200.0, 200.0, 0.0
+    for _ in range(300):
+        angles = angle + offsets
+        ends = np.array([x, y]) + np.stack((np.cos(angles), np.sin(angles)), axis=1) * 100
+        exact_hits, exact_dists, exact_ids = wall_set.raycast(np.array([x, y]), ends, 100)
+        hits, dists, ids = cache.raycast(wall_set, x, y, angles, 100)
+
+        np.testing.assert_array_equal(dists, exact_dists)
+        np.testing.assert_array_equal(ids, exact_ids)
+        np.testing.assert_array_equal(hits, exact_hits)
+
+        # Random walk with small steps, like a robot between sensor readings
+        angle += rng.uniform(-0.1, 0.1)
+        x = float(np.clip(x + 3 * np.cos(angle), 0, 400))
+        y = float(np.clip(y + 3 * np.sin(angle), 0, 400))
+
+    stats = cache.stats()
+    assert stats["hits"] > 0 and stats["misses"] > 0
+    assert stats["tested_fraction"] < 1.0
@@ -0,0 +1,119 @@
+import multiprocessing as mp
+import pickle
+import socket
+import struct
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from genetic.remote_evaluation import EvaluationCoordinator, run_worker, encode_message, decode_message, \
+    recv_message
+
+
+def _worker_main(host, port, fingerprint, log_path, delay):
+    """
+        Worker process, logs the size of every batch it starts before evaluating it for delay seconds
+    """
+    def evaluate_batch(genomes, scale=1.0):
+        with open(log_path, "a") as f:
+            f.write(f"{len(genomes)}\n")
+        time.sleep(delay)
+        return np.sum(genomes, axis=1) * scale
+
+    run_worker(evaluate_batch, fingerprint, host=host, port=port, heartbeat_interval=0.2)
+
+
+def _start_worker(address, fingerprint, log_path, delay=0.02):
+    # Spawned, so the worker decodes the messages in a fresh interpreter like a worker on another host
+    process = mp.get_context("spawn").Process(target=_worker_main,
+                                              args=(address[0], address[1], fingerprint, str(log_path), delay),
+                                              daemon=True)
+    process.start()
+    return process
+
+
+def _logged_batches(log_path):
+    if not log_path.exists():
+        return []
+    return [int(line) for line in log_path.read_text().split()]
+
+
+def _wait_for(condition, timeout=20):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_coordinator_with_two_worker_processes(tmp_path):
+    logs = [tmp_path / "a.log", tmp_path / "b.log"]
+    with EvaluationCoordinator("config", port=0, batch_size=3) as coordinator:
+        workers = [_start_worker(coordinator.address, "config", log_path, delay=0.1) for log_path in logs]
+        _wait_for(lambda: coordinator.num_workers() == 2)
+
+        genomes = np.random.default_rng(0).normal(size=(25, 4))
+        fitness = coordinator.evaluate_batch(genomes, scale=np.float64(2.0))
+        np.testing.assert_array_equal(fitness, np.sum(genomes, axis=1) * 2.0)
+
+    for worker in workers:
+        worker.join(timeout=10)
+        assert worker.exitcode == 0
+    batches = [_logged_batches(log_path) for log_path in logs]
+    assert sum(sum(sizes) for sizes in batches) == 25
+    assert all(len(sizes) > 0 for sizes in batches)
+
+
+def test_batch_of_killed_worker_is_requeued(tmp_path):
+    slow_log, fast_log = tmp_path / "slow.log", tmp_path / "fast.log"
+    with EvaluationCoordinator("config", port=0, batch_size=10) as coordinator:
+        slow = _start_worker(coordinator.address, "config", slow_log, delay=60)
+        _wait_for(lambda: coordinator.num_workers() == 1)
+
+        genomes = np.random.default_rng(1).normal(size=(10, 4))
+        result = {}
+        thread = threading.Thread(target=lambda: result.update(fitness=coordinator.evaluate_batch(genomes)),
+                                  daemon=True)
+        thread.start()
+
+        # Kill the worker in the middle of its batch, another worker has to finish it
+        _wait_for(lambda: _logged_batches(slow_log) == [10])
+        slow.kill()
+        slow.join(timeout=10)
+        fast = _start_worker(coordinator.address, "config", fast_log)
+
+        thread.join(timeout=30)
+        assert not thread.is_alive()
+        np.testing.assert_array_equal(result["fitness"], np.sum(genomes, axis=1))
+        assert coordinator.requeued == 1
+        assert _logged_batches(fast_log) == [10]
+
+    fast.join(timeout=10)
+    assert fast.exitcode == 0
+
+
+def test_worker_with_other_fingerprint_is_rejected():
+    with EvaluationCoordinator("config", port=0) as coordinator:
+        with pytest.raises(ValueError):
+            run_worker(lambda genomes: genomes[:, 0], "other config", host=coordinator.address[0],
+                       port=coordinator.address[1])
+
+
+def test_message_round_trip():
+    message = {"type": "batch", "id": 3, "genomes": np.arange(6, dtype=np.float64).reshape(2, 3),
+               "kwargs": {"episodes": (0, 2), "episode_seed": np.int64(7)}}
+    data = encode_message(message)
+    header_size, payload_size = struct.unpack("!IQ", data[:12])
+    decoded = decode_message(data[12:12 + header_size], data[12 + header_size:])
+    np.testing.assert_array_equal(decoded["genomes"], message["genomes"])
+    assert decoded["kwargs"] == {"episodes": [0, 2], "episode_seed": 7}
+
+
+def test_pickle_payload_is_rejected():
+    server, client = socket.socketpair()
+    with server, client:
+        payload = pickle.dumps({"type": "hello"})
+        client.sendall(struct.pack("!IQ", len(payload), 0) + payload)
+        with pytest.raises(ValueError):
+            recv_message(server)
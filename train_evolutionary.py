@@ -1,6 +1,12 @@
-from genetic.ANN import ANN
-from genetic.population import Population
-from simulation.world_generator import WorldGenerator
+from genetic.ANN import ANN, ANNBatch
+from genetic.population import ArrayPopulation
+from genetic.fitness_cache import FitnessCache
+from genetic.evaluation_pool import EvaluationPool
+from genetic.remote_evaluation import EvaluationCoordinator, run_worker
+from genetic.functions import spearman_correlation
+from genetic.early_stopping import EarlyStopping, TERMINATIONS
+from simulation.world_generator import WorldGenerator, RANDOM_WORLDS
+from simulation.vectorized_world import VectorizedWorld
 from gui.ann_controller import apply_action, exponential_decay
 import _experiments.visualize as visualize
 import matplotlib.pyplot as plt
@@ -8,19 +14,35 @@ import seaborn as sns
 import pandas as pd
 import numpy as np
 import os
+import math
 from datetime import datetime
+import time
+import queue
 import subprocess
+import argparse
 from pathlib import Path
 
 
-# import multiprocessing as mp
-# from itertools import repeat
-
-
 class ANNCoverageEvaluator:
     def __init__(self, generator, input_dims, output_dims, hidden_dims,
                  feedback, eval_seconds, step_size_ms, feedback_time,
-                 num_eval, normalization, world_name):
+                 num_eval, normalization, world_name, racing=False, min_episodes=2, elite_fraction=0.1,
+                 confidence_z=1.96, stop_window=0, min_displacement=0.0, stop_on_no_new_cells=False,
+                 score_threshold=None, multi_fidelity=False, coarse_step_ms=540, coarse_episodes=3, refine_top=20,
+                 control_samples=10):
+        """
+            @param racing: evaluate_racing stops evaluating genomes that can not reach the elite anymore
+            @param min_episodes: number of episodes every genome gets in racing mode
+            @param elite_fraction: the fraction of genomes that a genome is raced against
+            @param confidence_z: width of the confidence intervals in standard errors
+            @param stop_window, min_displacement, stop_on_no_new_cells, score_threshold: early termination rules of
+                   the episodes, see EarlyStopping
+            @param multi_fidelity: evaluate_multi_fidelity screens all genomes at a coarse time step and only
+                                   evaluates the best refine_top genomes (and control_samples random ones) at full
+                                   fidelity
+            @param coarse_step_ms: step size of the screening
+            @param coarse_episodes: number of episodes of the screening
+        """
         self.generator = generator
         self.input_dims = input_dims
         self.output_dims = output_dims
@@ -33,27 +55,297 @@ class ANNCoverageEvaluator:
         self.num_eval = num_eval
         self.normalization = normalization
         self.world_name = world_name
+        self.racing = racing
+        self.min_episodes = min_episodes
+        self.elite_fraction = elite_fraction
+        self.confidence_z = confidence_z
+
+        self.stop_window = stop_window
+        self.min_displacement = min_displacement
+        self.stop_on_no_new_cells = stop_on_no_new_cells
+        self.score_threshold = score_threshold
+
+        self.multi_fidelity = multi_fidelity
+        self.coarse_step_ms = coarse_step_ms
+        self.coarse_episodes = coarse_episodes
+        self.refine_top = refine_top
+        self.control_samples = control_samples
+        # Spearman rank correlation between the screening and the full evaluation of the random control genomes of
+        # every refinement
+        self.fidelity_correlations = []
+
+        # Episodes simulated by evaluate_racing, and the episodes full evaluations would have needed
+        self.raced_episodes = 0
+        self.full_episodes = 0
+        # How many episodes ended for every reason in TERMINATIONS
+        self.terminations = np.zeros(len(TERMINATIONS), dtype=np.int64)
+        # Hits, misses, tested walls and walls in reach of the ray caches of the serially evaluated robots
+        self.ray_cache_counts = np.zeros(4, dtype=np.int64)
 
     def generate_evaluate(self, genome, random_robot):
         world, robot = self.generator.create_world(random_robot=random_robot)
         return self.evaluate_in_world(world, robot, genome)
 
-    def evaluate(self, genome):
+    def evaluate(self, genome, episode_seed=None):
         scores = []
 
-        for step in range(10):
-            scores.append(self.generate_evaluate(genome, True))
+        bank = self.episode_bank(episode_seed)
+        for step in range(self.num_eval):
+            if bank is not None:
+                world, robot = self.generator.create_bank_world(step)
+                scores.append(self.evaluate_in_world(world, robot, genome))
+            else:
+                scores.append(self.generate_evaluate(genome, True))
 
         return np.mean(scores)
 
-        # Interesting result, not pooling is faster
-        # setup multitreath poolling
-        # threads = mp.cpu_count()
-        # self.pool = mp.Pool(threads)
-        #
-        # scores = [self.pool.apply(self.generate_evaluate, args=(genome, True)) for step in range(10)]
-        # print(scores)
-        # pool.close()
+    def episode_bank(self, episode_seed=None):
+        """
+            Returns the episode bank of the generator, or None if every evaluation gets new random episodes
+            @param episode_seed: seed of the bank to use, the bank is rebuilt if the generator has another one
+        """
+        bank = self.generator.episode_bank
+        if (episode_seed is not None) and ((bank is None) or (bank.seed != episode_seed)):
+            bank = self.generator.create_episode_bank(self.num_eval, episode_seed)
+        return bank
+
+    def early_stopping(self, num_episodes, world, step_size_ms=None):
+        """
+            Early termination rules for num_episodes episodes in world (a World or a VectorizedWorld)
+        """
+        step_size_ms = self.step_size_ms if step_size_ms is None else step_size_ms
+        steps = int((self.eval_seconds * 1000) / step_size_ms) + 1
+        # The window covers the same time at every step size
+        window = int(round(self.stop_window * self.step_size_ms / step_size_ms))
+        radius = self.generator.robot_radius
+        if isinstance(world, VectorizedWorld):
+            cell_size, max_v = world.cell_size, world.max_v
+        else:
+            cell_size, max_v = world.dustgrid.cell_size, world.robot.max_v
+        # The cells that a step of at most max_v can add to the bounding box of the robot, along both axes
+        max_step = max_v * step_size_ms / 1000
+        max_new_cells = 2 * (math.ceil(2 * radius / cell_size) + 2) * (math.ceil(max_step / cell_size) + 1)
+        total_cells = (self.generator.width // cell_size) * (self.generator.height // cell_size)
+        return EarlyStopping(num_episodes, steps, window=window, min_displacement=self.min_displacement,
+                             stop_on_no_new_cells=self.stop_on_no_new_cells, score_threshold=self.score_threshold,
+                             max_new_cells=max_new_cells, total_cells=total_cells)
+
+    def count_terminations(self, result, per_episode=False):
+        """
+            Adds the termination counts of evaluate_population(..., terminations=True) to the counts of this
+            evaluator, the result can come from another process
+            @return: the fitness, or the episode scores if per_episode
+        """
+        result = np.asarray(result)
+        self.terminations += np.sum(result[:, -len(TERMINATIONS):], axis=0).astype(np.int64)
+        scores = result[:, :-len(TERMINATIONS)]
+        return scores if per_episode else scores[:, 0]
+
+    def termination_report(self):
+        return dict(zip(TERMINATIONS, self.terminations.tolist()))
+
+    def ray_cache_report(self):
+        hits, misses, walls_tested, walls_total = self.ray_cache_counts.tolist()
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits + misses > 0 else 0.0,
+            "tested_fraction": walls_tested / walls_total if walls_total > 0 else 0.0
+        }
+
+    def evaluate_population(self, genomes, episode_seed=None, episodes=None, terminations=False, step_size_ms=None):
+        """
+            Evaluates all genomes on num_eval episodes each, all episodes are simulated in lock-step.
+            Every tick does one stacked forward pass of all the networks and one batched step per world layout.
+            @param genomes: (num_genomes, genome_size) genomes
+            @param episode_seed: evaluate all genomes on the episode bank with this seed, see episode_bank
+            @param episodes: (first, count), only simulate count episodes starting at episode first of the bank
+                             (or count random episodes without a bank) and return the score of every episode
+            @param terminations: append the number of episodes of every genome that ended for each reason in
+                                 TERMINATIONS as extra columns, see count_terminations
+            @param step_size_ms: simulate with another step size, the penalties are weighted by the step size so
+                                 the fitness stays an estimate of the fitness at step_size_ms
+            @return: the mean fitness of every genome, the same fitness as evaluate,
+                     or the (num_genomes, count) episode scores if episodes is given
+        """
+        genomes = np.asarray(genomes)
+        num_genomes = len(genomes)
+        first_episode, num_episodes = (0, self.num_eval) if episodes is None else episodes
+
+        # With an episode bank all genomes share the same episodes, so they only have to be built once
+        bank = self.episode_bank(episode_seed)
+        if bank is not None:
+            bank_worlds = [self.generator.create_bank_world(i)
+                           for i in range(first_episode, first_episode + num_episodes)]
+
+        # Generate the episodes, the episodes that share a wall layout are simulated in the same vectorized world
+        layouts = {}
+        for genome_id in range(num_genomes):
+            for i in range(num_episodes):
+                if bank is not None:
+                    world, robot = bank_worlds[i]
+                else:
+                    world, robot = self.generator.create_world(random_robot=True)
+                key = world.wall_set.starts.tobytes() + world.wall_set.ends.tobytes()
+                if key not in layouts:
+                    layouts[key] = {"wall_set": world.wall_set, "distance_field": world.distance_field,
+                                    "sensor_table": world.sensor_table, "robot": robot, "episodes": []}
+                layouts[key]["episodes"].append((genome_id, i, robot.x, robot.y, robot.angle))
+
+        worlds = []
+        genome_ids = []
+        episode_ids = []
+        for layout in layouts.values():
+            robot = layout["robot"]
+            poses = np.array(layout["episodes"])
+            world = VectorizedWorld(layout["wall_set"], self.generator.width, self.generator.height, len(poses),
+                                    radius=robot.radius, max_v=robot.max_v, n_sensors=robot.n_sensors,
+                                    max_sensor_length=robot.max_sensor_length, collision=robot.collision,
+                                    continuous_collision=robot.continuous_collision,
+                                    swept_coverage=self.generator.swept_coverage,
+                                    event_driven=self.generator.event_driven,
+                                    distance_field=layout["distance_field"], sensor_table=layout["sensor_table"])
+            world.set_robots(poses[:, 2], poses[:, 3], poses[:, 4])
+            worlds.append(world)
+            genome_ids.append(poses[:, 0].astype(np.int64))
+            episode_ids.append(poses[:, 1].astype(np.int64))
+        genome_ids = np.concatenate(genome_ids)
+        episode_ids = np.concatenate(episode_ids)
+
+        # Every genome gets one network with a column per episode, order the robots by genome and episode to match
+        # the columns
+        ann_batch = self.to_ann_batch(genomes, batch_size=num_episodes)
+        order = np.lexsort((episode_ids, genome_ids))
+        actions = np.empty((len(genome_ids), self.output_dims))
+
+        # Dirty Hack - Do an update to let the robots collect sensor data
+        for world in worlds:
+            world.update(0)
+
+        # We round up so that we'd rather overestimate evaluation time
+        step_size_ms = self.step_size_ms if step_size_ms is None else step_size_ms
+        steps = int((self.eval_seconds * 1000) / step_size_ms) + 1
+        delta_time = step_size_ms / 1000
+        # The penalty is a sum over the steps, with larger steps every step has to count for more time
+        penalty_weight = step_size_ms / self.step_size_ms
+        penalties = np.zeros(len(genome_ids))
+        stopping = self.early_stopping(len(genome_ids), worlds[0], step_size_ms)
+        for _ in range(steps):
+            active = stopping.active
+            if not np.any(active):
+                break
+
+            sensor_data = np.concatenate([world.sensor_data for world in worlds])
+            inp = exponential_decay(sensor_data[order]).reshape(num_genomes, num_episodes, -1).transpose(0, 2, 1)
+            output = ann_batch.predict(inp).transpose(0, 2, 1).reshape(len(genome_ids), -1)
+            actions[order] = output * 2 - 1
+
+            start = 0
+            for world in worlds:
+                end = start + world.n_robots
+                world.vl = actions[start:end, 0] * world.max_v
+                world.vr = actions[start:end, 1] * world.max_v
+                world.update(delta_time, active[start:end])
+                start = end
+
+            sensor_data = np.concatenate([world.sensor_data for world in worlds])
+            sensors = exponential_decay(sensor_data, start=100, end_factor=0.0, factor=1)
+            step_penalties = np.where(active, np.sum(sensors, axis=1), 0.0)
+            if penalty_weight != 1:
+                step_penalties *= penalty_weight
+            penalties += step_penalties
+
+            cleaned_cells = np.concatenate([world.cleaned_cells for world in worlds])
+            x = np.concatenate([world.x for world in worlds])
+            y = np.concatenate([world.y for world in worlds])
+            stopping.check(x, y, cleaned_cells, penalties, step_penalties)
+
+        cleaned_cells = np.concatenate([world.cleaned_cells for world in worlds])
+        scores = (cleaned_cells - penalties - stopping.remaining_penalties)[order].reshape(num_genomes, num_episodes)
+        if episodes is None:
+            scores = np.mean(scores, axis=1)[:, None]
+        if terminations:
+            codes = stopping.codes[order].reshape(num_genomes, num_episodes)
+            counts = np.stack([np.sum(codes == code, axis=1) for code in range(len(TERMINATIONS))], axis=1)
+            return np.concatenate((scores, counts), axis=1)
+        return scores if episodes is not None else scores[:, 0]
+
+    def evaluate_racing(self, genomes, episode_seed=None, evaluate_batch=None):
+        """
+            Adaptive evaluation in the style of racing: all genomes start with min_episodes episodes and the number
+            of episodes is doubled every round, but only for the genomes whose confidence interval still overlaps
+            with the elite. The fitness of a genome is the mean of the episodes it got.
+            @param evaluate_batch: evaluate_population or a function that calls it on other processes
+            @return: the fitness of every genome
+        """
+        evaluate_batch = self.evaluate_population if evaluate_batch is None else evaluate_batch
+        genomes = np.asarray(genomes)
+        num_genomes = len(genomes)
+        elite_size = max(1, int(math.ceil(self.elite_fraction * num_genomes)))
+
+        scores = np.full((num_genomes, self.num_eval), np.nan)
+        counts = np.zeros(num_genomes, dtype=np.int64)
+        racing = np.arange(num_genomes)
+        done = 0
+        while (len(racing) > 0) and (done < self.num_eval):
+            count = min(max(done, self.min_episodes), self.num_eval - done)
+            result = evaluate_batch(genomes[racing], episode_seed=episode_seed, episodes=(done, count),
+                                    terminations=True)
+            scores[racing, done:done + count] = self.count_terminations(result, per_episode=True)
+            counts[racing] += count
+            done += count
+
+            mean = np.nanmean(scores, axis=1)
+            # Genomes with a single episode have an unknown spread, they keep racing
+            with np.errstate(invalid="ignore", divide="ignore"):
+                std_error = np.where(counts > 1, np.nanstd(scores, axis=1, ddof=1) / np.sqrt(counts), np.inf)
+            lower = mean - self.confidence_z * std_error
+            upper = mean + self.confidence_z * std_error
+
+            # Race against the worst lower bound of the elite, the elite itself always stays in the race
+            elite = np.argsort(-mean)[:elite_size]
+            threshold = np.min(lower[elite])
+            racing = racing[upper[racing] >= threshold]
+
+        self.raced_episodes += int(np.sum(counts))
+        self.full_episodes += num_genomes * self.num_eval
+        return np.nanmean(scores, axis=1)
+
+    def evaluate_multi_fidelity(self, genomes, episode_seed=None, evaluate_batch=None):
+        """
+            Two tier evaluation: all genomes are screened on coarse_episodes episodes at coarse_step_ms, only the
+            best refine_top genomes are evaluated again on num_eval episodes at the full step size.
+            The other genomes keep their screening fitness. The best genomes alone would only show how well the
+            screening ranks the top of the population, so control_samples random genomes are refined as well and the
+            rank correlation of both tiers on those is added to fidelity_correlations.
+            @param evaluate_batch: evaluate_population or a function that calls it on other processes
+            @return: the fitness of every genome
+        """
+        evaluate_batch = self.evaluate_population if evaluate_batch is None else evaluate_batch
+        genomes = np.asarray(genomes)
+
+        result = evaluate_batch(genomes, episode_seed=episode_seed, episodes=(0, self.coarse_episodes),
+                                terminations=True, step_size_ms=self.coarse_step_ms)
+        fitness = np.mean(self.count_terminations(result, per_episode=True), axis=1)
+
+        top = np.argsort(-fitness, kind="stable")[:self.refine_top]
+        control = np.random.choice(len(genomes), min(self.control_samples, len(genomes)), replace=False)
+        refine = np.union1d(top, control)
+        refined = self.count_terminations(evaluate_batch(genomes[refine], episode_seed=episode_seed,
+                                                         terminations=True))
+        if len(control) > 1:
+            in_refine = np.searchsorted(refine, control)
+            self.fidelity_correlations.append(spearman_correlation(fitness[control], refined[in_refine]))
+        fitness[refine] = refined
+        return fitness
+
+    def racing_report(self):
+        saved = self.full_episodes - self.raced_episodes
+        return {
+            "episodes": self.raced_episodes,
+            "saved_episodes": saved,
+            "saved_fraction": saved / self.full_episodes if self.full_episodes > 0 else 0.0
+        }
 
     def evaluate_in_world(self, world, robot, genome):
         """
@@ -67,14 +359,25 @@ class ANNCoverageEvaluator:
         steps = int((self.eval_seconds * 1000) / self.step_size_ms) + 1
         delta_time = self.step_size_ms / 1000
         distance_sums = []
+        stopping = self.early_stopping(1, world)
         for _ in range(steps):
             apply_action(robot, ann, self.feedback)
             world.update(delta_time)
 
-            sensors = exponential_decay([dist for hit, dist in robot.sensor_data], start=100, end_factor=0.0, factor=1)
+            sensors = exponential_decay([dist for hit, dist in robot.get_sensor_data()], start=100, end_factor=0.0,
+                                        factor=1)
             distance_sums.append(np.sum(sensors))
+            stopping.check(robot.x, robot.y, world.dustgrid.cleaned_cells, np.sum(distance_sums),
+                           np.array([distance_sums[-1]]))
+            if not stopping.active[0]:
+                break
+
+        self.terminations += stopping.termination_counts()
+        if robot.ray_cache is not None:
+            cache = robot.ray_cache
+            self.ray_cache_counts += [cache.hits, cache.misses, cache.walls_tested, cache.walls_total]
         # If we hit negative values we are dead thus 0
-        return world.dustgrid.cleaned_cells - np.sum(distance_sums)
+        return world.dustgrid.cleaned_cells - np.sum(distance_sums) - stopping.remaining_penalties[0]
         # return max(0, world.dustgrid.cleaned_cells - np.sum(distance_sums) * 20)  # 100
 
     def get_genome_size(self):
@@ -92,9 +395,9 @@ class ANNCoverageEvaluator:
         genome_size += self.output_dims * (prev_dim + 1)
         return genome_size
 
-    def to_ann(self, genome):
+    def to_weight_matrices(self, genome):
         """
-            Initialize ANN manually with genome weights
+            Splits the genome into the ANN weight matrices
             @param genome: flattened ANN weights
         """
         prev_dim = self.input_dims
@@ -122,6 +425,24 @@ class ANNCoverageEvaluator:
         matrix = genome[prev_index:]
         matrix = matrix.reshape((self.output_dims, prev_dim + 1))
         weight_matrices.append(matrix)
+        return weight_matrices
+
+    def to_ann_batch(self, genomes, batch_size=1):
+        """
+            Initialize an ANNBatch with one network per genome
+            @param genomes: (num_genomes, genome_size) flattened ANN weights
+            @param batch_size: number of observations per network
+        """
+        weight_matrices = [np.stack(matrices) for matrices in
+                           zip(*[self.to_weight_matrices(genome) for genome in genomes])]
+        return ANNBatch(weight_matrices, batch_size=batch_size, feedback=self.feedback)
+
+    def to_ann(self, genome):
+        """
+            Initialize ANN manually with genome weights
+            @param genome: flattened ANN weights
+        """
+        weight_matrices = self.to_weight_matrices(genome)
 
         # Generate the ANN
         # ann = ANN(
@@ -141,26 +462,21 @@ class ANNCoverageEvaluator:
 
 
 def train(iterations, generator, evaluator, population, evaluator_args,
-          population_args, world_name, save_modulo=50, experiment=""):
+          population_args, world_name, save_modulo=50, experiment="", fitness_cache=None, episode_refresh=0):
     max_fitness = []
     avg_fitness = []
     diversity = []
-    if experiment == "":
-        experiment = f"{datetime.now():%Y-%m-%d_%H-%S-%f}"
-        experiment += "-" + world_name
-    experiment = os.path.join("_experiments", experiment)
-    if not os.path.isdir(experiment):
-        os.mkdir(experiment)
-
-    print("Start training experiment:", experiment)
-
-    # save our model params
-    with open(os.path.join(experiment, "population_args.txt"), "w+") as f:
-        f.write(str(population_args))
-    with open(os.path.join(experiment, "evaluator_args.txt"), "w+") as f:
-        f.write(str(evaluator_args))
+    experiment = create_experiment(experiment, world_name, evaluator_args, population_args)
 
     for i in range(iterations):
+        if (episode_refresh > 0) and (i > 0) and (i % episode_refresh == 0):
+            # New episodes so the population does not overfit on the bank, the old fitness values are not comparable
+            generator.refresh_episode_bank()
+            if fitness_cache is not None:
+                fitness_cache.set_config(cache_config(evaluator_fingerprint(evaluator_args), generator))
+            population.reevaluate()
+            print(f"{i} - new episode bank:\t {generator.episode_bank.seed}")
+
         population.select(population_args["selection_rate"])
         population.crossover()
         population.mutate()
@@ -180,19 +496,23 @@ def train(iterations, generator, evaluator, population, evaluator_args,
         #     break
 
         # Print iteration data
-        print(f"{i} - fitness:\t {evaluator.evaluate(fittest_genome['pos'])}")
+        if fitness_cache is not None:
+            # The fittest genome is in the cache, no need to simulate it again
+            print(f"{i} - fitness:\t {fitness_cache.evaluate(fittest_genome['pos'])}")
+            print("fitness cache:\t", fitness_cache.stats())
+        else:
+            print(f"{i} - fitness:\t {evaluator.evaluate(fittest_genome['pos'])}")
+        if evaluator.racing:
+            print("racing:\t", evaluator.racing_report())
+        if evaluator.multi_fidelity and len(evaluator.fidelity_correlations) > 0:
+            print("screening rank correlation:\t", evaluator.fidelity_correlations[-1])
+        print("episode terminations:\t", evaluator.termination_report())
+        if evaluator.generator.ray_cache_margin is not None:
+            print("ray cache:\t", evaluator.ray_cache_report())
         print(f"{i} - average fitness:\t {population.get_average_fitness()}")
         print("diversity:\t", population.get_average_diversity())
         if (i % save_modulo == 0) or (i == iterations - 1):
-            # Save the best genome
-            ann = evaluator.to_ann(fittest_genome['pos'])
-            model_name = f"model_{i}"
-            ann.save(os.path.join("_checkpoints", f"{model_name}.p"))
-            ann.save(os.path.join(experiment, f"{model_name}.p"))
-            # Take a snapshot of what robot outcomes look like
-            subprocess.call(["python3", "main.py", "--snapshot",
-                             "--snapshot_dir", f"{experiment}/{model_name}.png",
-                             "--model_name", f"{model_name}.p", "--world_name", world_name])
+            ann = save_model(evaluator, fittest_genome['pos'], f"model_{i}", experiment, world_name)
 
     history = pd.DataFrame({
         "Max_Fitness": max_fitness,
@@ -205,6 +525,189 @@ def train(iterations, generator, evaluator, population, evaluator_args,
     return ann, history
 
 
+def train_steady_state(evaluations, evaluator, population, pool, evaluator_args, population_args, world_name,
+                       tournament_size=3, report_every=100, save_modulo=50, experiment="", episode_seed=None,
+                       fitness_cache=None):
+    """
+        Steady state evolution without generational barriers. Every worker of the pool gets a new child as soon as
+        it is done with the previous one, every evaluated child is inserted by tournament replacement.
+        Every <report_every> evaluations the fitness and the throughput is added to the history.
+        With an episode bank the bank is never refreshed, there are no generations to refresh it at.
+        Children are evaluated one at a time, so the batch schemes (racing, multi fidelity) are not used.
+        @param fitness_cache: children that are already cached are inserted without evaluating them again
+    """
+    max_fitness = []
+    avg_fitness = []
+    diversity = []
+    evaluations_per_second = []
+    worker_utilization = []
+    experiment = create_experiment(experiment, world_name, evaluator_args, population_args)
+
+    # The pool calls back from its result thread, the results are processed here in the training loop
+    results = queue.Queue()
+    errors = queue.Queue()
+    submitted = 0
+
+    def on_result(genomes, result, elapsed):
+        results.put((genomes, result, elapsed, False))
+
+    def submit():
+        nonlocal submitted
+        submitted += 1
+        genomes = population.breed(1)
+        fitness = fitness_cache.lookup(genomes[0]) if fitness_cache is not None else None
+        if fitness is not None:
+            results.put((genomes, fitness, 0.0, True))
+            return
+        pool.submit(genomes, on_result, error_callback=errors.put, episode_seed=episode_seed, terminations=True)
+
+    for _ in range(min(pool.processes, evaluations)):
+        submit()
+
+    done = 0
+    reported = 0
+    report_start = time.time()
+    busy_time = 0.0
+    while done < evaluations:
+        try:
+            genomes, result, elapsed, cached = results.get(timeout=1)
+        except queue.Empty:
+            if not errors.empty():
+                raise errors.get()
+            continue
+
+        if cached:
+            fitness = result
+        else:
+            # The episodes ended on another process, count why they ended here
+            fitness = evaluator.count_terminations(result)[0]
+            if fitness_cache is not None:
+                fitness_cache.store(genomes[0], fitness)
+        done += 1
+        busy_time += elapsed
+        population.tournament_replace(genomes[0], fitness, tournament_size)
+        if submitted < evaluations:
+            submit()
+
+        if (done % report_every == 0) or (done == evaluations):
+            i = len(max_fitness)
+            wall_time = time.time() - report_start
+            fittest_genome = population.get_fittest_genome()
+            max_fitness.append(population.get_max_fitness())
+            avg_fitness.append(population.get_average_fitness())
+            diversity.append(population.get_average_diversity())
+            # The last report can cover fewer than report_every evaluations
+            evaluations_per_second.append((done - reported) / wall_time)
+            worker_utilization.append(busy_time / (pool.processes * wall_time))
+            reported = done
+            report_start = time.time()
+            busy_time = 0.0
+
+            print(f"{i} - evaluations:\t {done}")
+            print(f"{i} - fitness:\t {max_fitness[-1]}")
+            print(f"{i} - average fitness:\t {avg_fitness[-1]}")
+            print("diversity:\t", diversity[-1])
+            print(f"evaluations/s:\t {evaluations_per_second[-1]:.2f}, "
+                  f"worker utilization:\t {worker_utilization[-1]:.2f}")
+            print("episode terminations:\t", evaluator.termination_report())
+            if fitness_cache is not None:
+                print("fitness cache:\t", fitness_cache.stats())
+            if (i % save_modulo == 0) or (done == evaluations):
+                ann = save_model(evaluator, fittest_genome['pos'], f"model_{i}", experiment, world_name)
+
+    history = pd.DataFrame({
+        "Max_Fitness": max_fitness,
+        "Avg_Fitness": avg_fitness,
+        "Diversity": diversity,
+        "Evaluations_Per_Second": evaluations_per_second,
+        "Worker_Utilization": worker_utilization,
+        "Iteration": [i for i in range(len(max_fitness))]
+    })
+    g = visualize.show_history(history, path=os.path.join(experiment, "ev_algo.png"))
+    save_history(history, experiment)
+    return ann, history
+
+
+def create_experiment(experiment, world_name, evaluator_args, population_args):
+    if experiment == "":
+        experiment = f"{datetime.now():%Y-%m-%d_%H-%S-%f}"
+        experiment += "-" + world_name
+    experiment = os.path.join("_experiments", experiment)
+    if not os.path.isdir(experiment):
+        os.mkdir(experiment)
+
+    print("Start training experiment:", experiment)
+
+    # save our model params
+    with open(os.path.join(experiment, "population_args.txt"), "w+") as f:
+        f.write(str(population_args))
+    with open(os.path.join(experiment, "evaluator_args.txt"), "w+") as f:
+        f.write(str(evaluator_args))
+    return experiment
+
+
+def save_model(evaluator, genome, model_name, experiment, world_name):
+    # Save the best genome
+    ann = evaluator.to_ann(genome)
+    ann.save(os.path.join("_checkpoints", f"{model_name}.p"))
+    ann.save(os.path.join(experiment, f"{model_name}.p"))
+    # Take a snapshot of what robot outcomes look like
+    subprocess.call(["python3", "main.py", "--snapshot",
+                     "--snapshot_dir", f"{experiment}/{model_name}.png",
+                     "--model_name", f"{model_name}.p", "--world_name", world_name])
+    return ann
+
+
+def create_batch_evaluator(generator_args, evaluator_args):
+    """
+        Builds the world generator and evaluator of a worker process, returns its batch evaluation function
+    """
+    generator = WorldGenerator(**generator_args)
+    evaluator = ANNCoverageEvaluator(generator=generator, **evaluator_args)
+    return evaluator.evaluate_population
+
+
+def evaluator_fingerprint(evaluator_args):
+    """
+        String that identifies the evaluation config, the generator is described by its settings instead of its
+        object address
+    """
+    args = {key: value for key, value in evaluator_args.items() if key != "generator"}
+    generator = evaluator_args["generator"]
+    # Every setting that changes the start locations or the simulation. Left out are sensor_table_dir (only where
+    # the tables are stored) and ray_cache_margin (the cached raycasts are exact)
+    args["generator"] = (generator.width, generator.height, generator.robot_radius, generator.world_name,
+                         generator.scenario, generator.collision, generator.free_start, generator.free_space_cell_size,
+                         generator.exact_check, generator.continuous_collision, generator.swept_coverage,
+                         generator.raster_resolution, generator.max_sensor_length, generator.sensor_table_resolution,
+                         generator.sensor_table_angles, generator.event_driven, generator.sensor_period)
+    return str(sorted(args.items()))
+
+
+def cache_config(fingerprint, generator):
+    """
+        The fitness of a genome also depends on the episode bank it was evaluated on
+    """
+    if generator.episode_bank is None:
+        return fingerprint
+    return f"{fingerprint} episode_bank={generator.episode_bank.seed}"
+
+
+def print_raster_reports(generator):
+    """
+        Prints the error of the distance fields and sensor tables of the layouts against the exact raycasts and
+        distances. This also builds (or loads) the sensor tables before the workers need them
+    """
+    for world_name in (RANDOM_WORLDS if generator.world_name == "random" else [generator.world_name]):
+        world, _ = generator.create_episode(world_name)
+        if world.distance_field is not None:
+            print(f"distance field {world_name}:\t", world.distance_field.error_report())
+        if world.sensor_table is not None:
+            source = "loaded" if world.sensor_table.loaded else "built"
+            print(f"sensor table {world_name} ({source}):\t",
+                  world.sensor_table.error_report(min_clearance=generator.robot_radius))
+
+
 def save_history(history, experiment):
     timestamp = f"{datetime.now():%Y-%m-%d_%H-%S-%f}"
     file_name = os.path.join(experiment, f"{timestamp}.csv")
@@ -212,6 +715,38 @@ def save_history(history, experiment):
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mode", default="train", choices=["train", "worker"],
+                        help="'train' runs the evolution, 'worker' evaluates genomes for a remote coordinator")
+    parser.add_argument("--remote", action="store_true", default=False,
+                        help="train with remote evaluation workers instead of the local process pool")
+    parser.add_argument("--host", default="localhost",
+                        help="coordinator address for the workers and the interface the coordinator listens on, "
+                             "use 0.0.0.0 to accept workers from other hosts (they are not authenticated)")
+    parser.add_argument("--port", type=int, default=5005, help="coordinator port")
+    parser.add_argument("--processes", type=int, default=os.cpu_count(),
+                        help="number of local evaluation processes")
+    parser.add_argument("--steady_state", action="store_true", default=False,
+                        help="asynchronous steady state evolution on the local process pool, "
+                             "not with --remote, --racing or --multi_fidelity")
+    parser.add_argument("--early_stop", action="store_true", default=False,
+                        help="end episodes early when the robot is stuck or does not clean anything new")
+    parser.add_argument("--multi_fidelity", action="store_true", default=False,
+                        help="screen all genomes at a coarse time step and only evaluate the best at full fidelity, "
+                             "not with --racing")
+    parser.add_argument("--racing", action="store_true", default=False,
+                        help="stop evaluating genomes early when they can not reach the elite anymore")
+    parser.add_argument("--episode_refresh", type=int, default=0,
+                        help="evaluate all genomes on the same episode bank and refresh it every N generations, "
+                             "0 gives every evaluation its own random episodes")
+    args = parser.parse_args()
+    if args.mode == "train" and args.steady_state and args.remote:
+        parser.error("--steady_state runs on the local process pool, it can not be combined with --remote")
+    if args.mode == "train" and args.steady_state and (args.racing or args.multi_fidelity):
+        parser.error("--steady_state evaluates one child at a time, --racing and --multi_fidelity need batches")
+    if args.multi_fidelity and args.racing:
+        parser.error("--multi_fidelity and --racing are different evaluation schemes, pick one")
+
     # Create folder for saving models
     Path("_checkpoints").mkdir(parents=True, exist_ok=True)
 
@@ -220,6 +755,7 @@ if __name__ == "__main__":
     HEIGHT = 400
     POP_SIZE = 100
     FEEDBACK = True
+    PROCESSES = args.processes
     world_names = ["rect_world", "double_rect_world", "trapezoid_world", "double_trapezoid_world", "star_world",
                    "random"]
     world_num = 4
@@ -230,7 +766,36 @@ if __name__ == "__main__":
         "n_sensors": 12,
         "max_sensor_length": 100
     }
-    generator = WorldGenerator(WIDTH, HEIGHT, 20, world_name)
+    generator_args = {
+        "width": WIDTH,
+        "height": HEIGHT,
+        "robot_radius": 20,
+        "world_name": world_name,
+        "scenario": "evolutionary",
+        "collision": True,
+        "free_start": False,
+        # Needed for safe larger steps, see step_size_ms
+        "continuous_collision": False,
+        "swept_coverage": False,
+        # One exact step per controller tick: drive along the arc to the tick or the first wall contact and clean along
+        # the driven path, makes continuous_collision and swept_coverage unnecessary
+        "event_driven": False,
+        # Resolution of the distance field for the sensors, None for exact raycasts. Check the resolution with
+        # DistanceField.error_report, see print_raster_reports
+        "raster_resolution": None,
+        "max_sensor_length": robot_args["max_sensor_length"],
+        # Resolution of the precomputed sensor readings, None for raycasts. The tables are cached in sensor_table_dir
+        "sensor_table_resolution": None,
+        "sensor_table_angles": 360,
+        "sensor_table_dir": "sensor_tables",
+        # Reuse the candidate walls of the sensor rays between steps, only affects the serial evaluation
+        "ray_cache_margin": None,
+        # Seconds between the sensor readings of the robots, 0 senses on every step, see Robot
+        "sensor_period": 0.0
+    }
+    generator = WorldGenerator(**generator_args)
+    if (generator.raster_resolution is not None) or (generator.sensor_table_resolution is not None):
+        print_raster_reports(generator)
 
 
     # Good until here
@@ -245,13 +810,67 @@ if __name__ == "__main__":
         "step_size_ms": 270,  # 270
         "feedback_time": 270,  # 540
         "num_eval": 10,
-        "normalization": robot_args["max_sensor_length"]
+        "normalization": robot_args["max_sensor_length"],
+        "racing": args.racing,
+        "multi_fidelity": args.multi_fidelity,
+        # Stop an episode when the robot moved less than its radius or cleaned nothing over 20 steps (5.4s)
+        "stop_window": 20 if args.early_stop else 0,
+        "min_displacement": 20,
+        "stop_on_no_new_cells": True
     }
     evaluator = ANNCoverageEvaluator(**evaluator_args)
+    fingerprint = evaluator_fingerprint(evaluator_args)
+
+    # Every worker process builds its own generator and evaluator once
+    factory_args = {
+        "generator_args": generator_args,
+        "evaluator_args": {key: value for key, value in evaluator_args.items() if key != "generator"}
+    }
+    pool = None
+    coordinator = None
+    if args.mode == "train" and args.remote:
+        coordinator = EvaluationCoordinator(fingerprint, host=args.host, port=args.port, batch_size=10)
+        print(f"Waiting for evaluation workers on {args.host}:{args.port}")
+        evaluate_batch = coordinator.evaluate_batch
+    elif PROCESSES > 1 or args.steady_state:
+        pool = EvaluationPool(factory=create_batch_evaluator, factory_args=factory_args, processes=PROCESSES)
+        evaluate_batch = pool.evaluate_batch
+    else:
+        evaluate_batch = create_batch_evaluator(**factory_args)
+
+    if args.mode == "worker":
+        # Evaluate the batches of a coordinator on another host, until it stops
+        print(f"Evaluation worker for {args.host}:{args.port} with {PROCESSES} processes")
+        run_worker(evaluate_batch, fingerprint, host=args.host, port=args.port)
+        if pool is not None:
+            pool.close()
+        exit()
+
+    if args.episode_refresh > 0:
+        generator.create_episode_bank(evaluator_args["num_eval"])
+
+    def evaluate_genomes(genomes):
+        # The workers have their own generator, they rebuild the current episode bank from its seed
+        episode_seed = generator.episode_bank.seed if generator.episode_bank is not None else None
+        if args.multi_fidelity:
+            return evaluator.evaluate_multi_fidelity(genomes, episode_seed=episode_seed, evaluate_batch=evaluate_batch)
+        if args.racing:
+            # The racing is done here, only the episodes are simulated by the workers
+            return evaluator.evaluate_racing(genomes, episode_seed=episode_seed, evaluate_batch=evaluate_batch)
+        # The episodes can end on other processes, count why they ended here
+        return evaluator.count_terminations(evaluate_batch(genomes, episode_seed=episode_seed, terminations=True))
+
+    fitness_cache = FitnessCache(
+        eval_func=evaluator.evaluate,
+        eval_batch=evaluate_genomes,
+        config=cache_config(fingerprint, generator),
+        max_size=10000
+    )
     population_args = {
         "pop_size": POP_SIZE,
         "genome_size": evaluator.get_genome_size(),
-        "eval_func": evaluator.evaluate,
+        "eval_func": fitness_cache.evaluate,
+        "eval_batch": fitness_cache.evaluate_batch,
         "init_func": np.random.normal,
         "weight_scale": 1.0,
         "mutation_rate": 0.1,
@@ -259,10 +878,11 @@ if __name__ == "__main__":
         "selection_rate": 0.9
     }
 
-    population = Population(
+    population = ArrayPopulation(
         pop_size=population_args["pop_size"],
         genome_size=population_args["genome_size"],
         eval_func=population_args["eval_func"],
+        eval_batch=population_args["eval_batch"],
         mutation_rate=population_args["mutation_rate"],
         mutation_scale=population_args["mutation_scale"],
         init_func=np.random.normal
@@ -271,15 +891,36 @@ if __name__ == "__main__":
     # Train
     iterations = 200
     # ann, history = train(iterations=iterations, generator=generator, evaluator=evaluator, population=population)
-    ann, history = train(
-        iterations=iterations,
-        generator=generator,
-        evaluator=evaluator,
-        population=population,
-        world_name=world_name,
-        evaluator_args=evaluator_args,
-        population_args=population_args
-    )
+    if args.steady_state:
+        # About as many evaluations as the generational training does
+        ann, history = train_steady_state(
+            evaluations=iterations * POP_SIZE,
+            evaluator=evaluator,
+            population=population,
+            pool=pool,
+            world_name=world_name,
+            evaluator_args=evaluator_args,
+            population_args=population_args,
+            report_every=POP_SIZE,
+            episode_seed=generator.episode_bank.seed if generator.episode_bank is not None else None,
+            fitness_cache=fitness_cache
+        )
+    else:
+        ann, history = train(
+            iterations=iterations,
+            generator=generator,
+            evaluator=evaluator,
+            population=population,
+            world_name=world_name,
+            evaluator_args=evaluator_args,
+            population_args=population_args,
+            fitness_cache=fitness_cache,
+            episode_refresh=args.episode_refresh
+        )
+    if coordinator is not None:
+        coordinator.close()
+    if pool is not None:
+        pool.close()
 
     g = visualize.show_history(history)
     plt.show()